@@ -8,40 +8,108 @@ from itertools import islice
 from plumbing.color import Color
 
 ################################################################################
-def convert_to_sql(dest, keys, values, sql_field_types=None):
+def convert_to_sql(dest, keys, values, sql_field_types=None, table='data',
+                   batch_size=100000, index='id', resume=False, progress=False):
+    """
+    Stream rows into a new SQLite table, one transaction per batch, with
+    the connection tuned for bulk loading. Memory use does not depend on
+    the number of rows.
+
+    * The keys are the column names and the values an iterable of tuples,
+      typically a generator.
+
+    * The sql_field_types option maps column names to SQL types, the
+      default being 'text'.
+
+    * The batch_size option is the number of rows committed at a time.
+
+    * The index option is the column indexed once all rows are in, or
+      `None` for no index. Building it at the end is much faster than
+      maintaining it during the insertion.
+
+    * The resume option continues a conversion that was interrupted. The
+      rows already committed are counted and as many are skipped from the
+      values, which must hence come in the same order as the first time.
+
+    * The progress option displays the number of rows and the rate.
+
+    Returns the total number of rows in the table.
+    """
+    # Default values #
     if sql_field_types is None: sql_field_types = {}
-    with sqlite3.connect(dest) as connection:
-        # Prepare #
-        cursor = connection.cursor()
+    values = iter(values)
+    # Autocommit mode, we handle the transactions ourselves #
+    connection = sqlite3.connect(dest, isolation_level=None)
+    cursor     = connection.cursor()
+    # Settings for bulk loading. WAL keeps committed batches safe #
+    cursor.execute("PRAGMA journal_mode = WAL;")
+    cursor.execute("PRAGMA synchronous = OFF;")
+    cursor.execute("PRAGMA cache_size = -262144;")
+    cursor.execute("PRAGMA temp_store = MEMORY;")
+    # Create the table or find where we stopped #
+    query  = "SELECT EXISTS(SELECT 1 FROM sqlite_master WHERE type='table' AND name=?);"
+    exists = cursor.execute(query, (table,)).fetchone()[0]
+    if exists and not resume:
+        connection.close()
+        raise Exception("The table '%s' exists already in '%s'." % (table, dest))
+    if exists:
+        done = cursor.execute('SELECT COUNT(1) FROM "%s";' % table).fetchone()[0]
+        for row in islice(values, done): pass
+    else:
+        done   = 0
         fields = ','.join(['"' + f + '"' + ' ' + sql_field_types.get(f, 'text') for f in keys])
-        cursor.execute("CREATE table 'data' (%s)" % fields)
-        question_marks = '(' + ','.join(['?' for x in keys]) + ')'
-        sql_command = "INSERT into 'data' values " + question_marks
-        # Main loop #
-        try:
-            cursor.executemany(sql_command, values)
-        except (ValueError, sqlite3.OperationalError, sqlite3.ProgrammingError, sqlite3.InterfaceError) as err:
-            first_elem = islice(values, 0, 1)
-            message1 = "The command <%s%s%s> on the database '%s' failed with error:\n %s%s%s"
-            message1 = message1 % (Color.cyn, sql_command, Color.end, dest, Color.u_red, err, Color.end)
-            message2 = "\n * %sThe bindings (%i) %s: %s \n * %sYou gave%s: %s"
-            message2 = message2 % (Color.b_ylw, len(keys), Color.end, keys, Color.b_ylw, Color.end, values)
-            message3 = "\n * %sFirst element (%i)%s: %s \n"
-            message3 = message3 % (Color.b_ylw, len(first_elem) if first_elem else 0, Color.end, first_elem)
-            raise Exception(message1 + message2 + message3)
-        except KeyboardInterrupt as err:
-            print("You interrupted the creation of the database. Committing everything done up to this point.")
-            connection.commit()
-            cursor.close()
-            raise err
-        # Index #
+        cursor.execute('CREATE table "%s" (%s);' % (table, fields))
+    # The insert statement #
+    question_marks = '(' + ','.join(['?' for x in keys]) + ')'
+    sql_command    = 'INSERT into "%s" values %s;' % (table, question_marks)
+    # Display progress #
+    if progress:
+        import tqdm
+        bar = tqdm.tqdm(unit=' rows', initial=done, unit_scale=True)
+    # Main loop #
+    errors = (ValueError, sqlite3.OperationalError, sqlite3.ProgrammingError,
+              sqlite3.InterfaceError)
+    try:
+        for batch in iter(lambda: list(islice(values, batch_size)), []):
+            try:
+                cursor.execute("BEGIN;")
+                cursor.executemany(sql_command, batch)
+                cursor.execute("COMMIT;")
+            except errors as err:
+                cursor.execute("ROLLBACK;")
+                first_elem = batch[0]
+                message1 = "The command <%s%s%s> on the database '%s' failed with error:\n %s%s%s"
+                message1 = message1 % (Color.cyn, sql_command, Color.end, dest, Color.u_red, err, Color.end)
+                message2 = "\n * %sThe bindings (%i) %s: %s \n * %sRows committed before%s: %i"
+                message2 = message2 % (Color.b_ylw, len(keys), Color.end, keys, Color.b_ylw, Color.end, done)
+                message3 = "\n * %sFirst element of the batch (%i)%s: %s \n"
+                message3 = message3 % (Color.b_ylw, len(first_elem), Color.end, first_elem)
+                raise Exception(message1 + message2 + message3)
+            done += len(batch)
+            if progress: bar.update(len(batch))
+    except KeyboardInterrupt as err:
+        if connection.in_transaction: cursor.execute("ROLLBACK;")
+        connection.close()
+        print("You interrupted the creation of the database. %i rows were committed," % done)
+        print("call again with `resume=True` to continue from there.")
+        raise err
+    except Exception as err:
+        connection.close()
+        raise err
+    finally:
+        if progress: bar.close()
+    # Index #
+    if index is not None:
         try:
-            cursor.execute("CREATE INDEX if not exists 'data_index' on 'data' (id)")
+            query = 'CREATE INDEX if not exists "%s_index" on "%s" ("%s");'
+            cursor.execute(query % (table, table, index))
         except KeyboardInterrupt as err:
-            print("You interrupted the creation of the index. Committing everything done up to this point.")
-            connection.commit()
-            cursor.close()
+            print("You interrupted the creation of the index. All rows were committed.")
+            connection.close()
             raise err
-        # Close #
-        connection.commit()
-        cursor.close()
+    # Back to a single file #
+    cursor.execute("PRAGMA journal_mode = DELETE;")
+    # Close #
+    cursor.close()
+    connection.close()
+    return done
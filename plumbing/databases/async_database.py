@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Written by Lucas Sinclair.
+MIT Licensed.
+Contact at www.sinclair.bio
+"""
+
+# Built-in modules #
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+# Internal modules #
+from plumbing.databases.sqlite_database import SQLiteDatabase
+
+################################################################################
+class AsyncSQLiteDatabase(object):
+    """
+    An asyncio facade over an `SQLiteDatabase` for use in services that
+    must not block their event loop. Every statement runs in a thread.
+
+    There is a pool of workers, each one being a single thread owning its
+    own `SQLiteDatabase` object and hence its own connection, since SQLite
+    connections should not be shared across threads. Concurrent calls are
+    spread across the idle workers, so several reads proceed in parallel.
+
+    Use it like this:
+
+        >>> from plumbing.databases.async_database import AsyncSQLiteDatabase
+        >>> async with AsyncSQLiteDatabase('reads.db', readonly=True) as db:
+        >>>     entry = await db.get_entry('JCVI_PEP_1112677232278')
+        >>>     df    = await db.read_df(columns=['id', 'length'])
+        >>>     async for row in db.iterate('SELECT * FROM "data";'):
+        >>>         print(row)
+    """
+
+    def __init__(self, path, pool_size=4, **kwargs):
+        """
+        * The path of the database comes first.
+
+        * The pool_size is the number of read connections, each with
+          its own thread.
+
+        * Any other keyword argument is passed to every `SQLiteDatabase`,
+          for instance `readonly=True` or `factory=...`.
+        """
+        self.path      = path
+        self.pool_size = pool_size
+        self.kwargs    = kwargs
+        self.workers   = []
+        self.idle      = None
+
+    def __repr__(self):
+        """Called when evaluating ``print(database)``."""
+        return '<%s object on "%s">' % (self.__class__.__name__, self.path)
+
+    async def __aenter__(self):
+        """Called when entering the 'async with' statement."""
+        await self.open()
+        return self
+
+    async def __aexit__(self, errtype, value, traceback):
+        """Called when exiting the 'async with' statement."""
+        await self.close()
+
+    # ------------------------------- Workers ------------------------------- #
+    async def open(self):
+        """Start the threads and open one connection in each of them."""
+        if self.workers: return
+        # The checks in `prepare()` are only done once #
+        loop  = asyncio.get_running_loop()
+        first = SQLiteDatabase(self.path, **self.kwargs)
+        await loop.run_in_executor(None, first.prepare)
+        # Create the workers #
+        self.idle = asyncio.Queue()
+        for i in range(self.pool_size):
+            worker = Worker(self.path, self.kwargs)
+            await worker.run(worker.start)
+            self.workers.append(worker)
+            self.idle.put_nowait(worker)
+
+    async def close(self):
+        """Close all connections and stop the threads."""
+        for worker in self.workers: await worker.run(worker.stop)
+        for worker in self.workers: worker.executor.shutdown()
+        self.workers = []
+        self.idle    = None
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Call `func(database, *args, **kwargs)` in the thread of an idle
+        worker, waiting for one to be free if needed. The `database` is
+        the `SQLiteDatabase` object owned by that worker.
+        """
+        if not self.workers: await self.open()
+        worker = await self.idle.get()
+        try:
+            return await worker.run(func, worker.database, *args, **kwargs)
+        finally:
+            self.idle.put_nowait(worker)
+
+    # ------------------------------- Queries ------------------------------- #
+    async def get_entry(self, key, column=None, table=None):
+        """Get a specific entry."""
+        return await self.run(SQLiteDatabase.get_entry, key, column, table)
+
+    async def count_entries(self, table=None):
+        """How many rows in a table."""
+        return await self.run(SQLiteDatabase.count_entries, table)
+
+    async def execute(self, query, params=()):
+        """Execute a statement and return all the resulting rows as a list."""
+        def fetch_all(database):
+            return database.own_connection.execute(query, params).fetchall()
+        return await self.run(fetch_all)
+
+    async def read_df(self, *args, **kwargs):
+        """Same as `SQLiteDatabase.read_df()` without the chunksize option."""
+        if kwargs.get('chunksize') is not None:
+            raise Exception("Use `iterate()` to read by chunks asynchronously.")
+        return await self.run(SQLiteDatabase.read_df, *args, **kwargs)
+
+    async def iterate(self, query=None, params=(), batch_size=1000):
+        """
+        Yield the rows of a query, by default the whole main table. The rows
+        are fetched `batch_size` at a time and the same worker is kept for
+        the whole iteration since a cursor belongs to its connection.
+        """
+        if not self.workers: await self.open()
+        worker = await self.idle.get()
+        try:
+            # Execute #
+            if query is None: query = 'SELECT * from "%s";' % worker.database.main_table
+            def execute(database):
+                return database.open_cursor().execute(query, params)
+            cursor = await worker.run(execute, worker.database)
+            # Fetch #
+            while True:
+                rows = await worker.run(cursor.fetchmany, batch_size)
+                if not rows: break
+                for row in rows: yield row
+            worker.database.release_cursor(cursor)
+            await worker.run(cursor.close)
+        finally:
+            self.idle.put_nowait(worker)
+
+###############################################################################
+class Worker(object):
+    """A single thread owning a single `SQLiteDatabase` and its connection."""
+
+    def __init__(self, path, kwargs):
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix='sqlite')
+        self.database = SQLiteDatabase(path, **kwargs)
+        # Was already done once by the parent #
+        self.database.prepared = True
+
+    def start(self):
+        """Open the connection, must be called from the worker thread."""
+        return self.database.own_connection
+
+    def stop(self):
+        """Close the connection, must be called from the worker thread."""
+        self.database.close()
+
+    async def run(self, func, *args, **kwargs):
+        """Run a function in this worker's thread and wait for the result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: func(*args, **kwargs))
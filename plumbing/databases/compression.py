@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Written by Lucas Sinclair.
+MIT Licensed.
+Contact at www.sinclair.bio
+"""
+
+# Built-in modules #
+import zlib
+
+# The table where the compressed columns are declared #
+meta_table = 'compressed_columns'
+
+################################################################################
+class ColumnCodec(object):
+    """
+    Compresses the text values of a column to BLOBs and back. Two methods
+    are available: 'zlib' from the standard library, and 'zstd' which
+    requires the `zstandard` module but is both faster and tighter.
+
+    An optional dictionary shared by all the values of the column greatly
+    improves the compression of short values such as sequence descriptions,
+    since each value on its own contains too little repetition.
+    """
+
+    def __init__(self, method='zlib', level=None, dictionary=None):
+        # Check #
+        if method not in ('zlib', 'zstd'):
+            raise Exception("Unknown compression method '%s'." % method)
+        # Attributes #
+        self.method     = method
+        self.level      = level
+        self.dictionary = dictionary
+        # Default level #
+        if self.level is None: self.level = 6 if method == 'zlib' else 3
+
+    def __repr__(self):
+        msg = '<%s object using %s at level %i%s>'
+        dictionary = ' with a dictionary' if self.dictionary else ''
+        return msg % (self.__class__.__name__, self.method, self.level, dictionary)
+
+    # ------------------------------- Methods ------------------------------- #
+    def compress(self, value):
+        """Compress a string (or bytes) to bytes. `None` is left alone."""
+        if value is None: return None
+        if isinstance(value, str): value = value.encode()
+        # zlib #
+        if self.method == 'zlib':
+            if not self.dictionary: return zlib.compress(value, self.level)
+            compressor = zlib.compressobj(self.level, zdict=self.dictionary)
+            return compressor.compress(value) + compressor.flush()
+        # zstd #
+        return self.zstd_compressor.compress(value)
+
+    def decompress(self, value):
+        """Decompress bytes to a string. Anything else is left alone."""
+        if not isinstance(value, bytes): return value
+        # zlib #
+        if self.method == 'zlib':
+            if not self.dictionary: return zlib.decompress(value).decode()
+            decompressor = zlib.decompressobj(zdict=self.dictionary)
+            return (decompressor.decompress(value) + decompressor.flush()).decode()
+        # zstd #
+        return self.zstd_decompressor.decompress(value).decode()
+
+    @property
+    def zstd_dict(self):
+        import zstandard
+        if not self.dictionary: return None
+        return zstandard.ZstdCompressionDict(self.dictionary)
+
+    @property
+    def zstd_compressor(self):
+        if not hasattr(self, '_zstd_compressor'):
+            import zstandard
+            self._zstd_compressor = zstandard.ZstdCompressor(level     = self.level,
+                                                             dict_data = self.zstd_dict)
+        return self._zstd_compressor
+
+    @property
+    def zstd_decompressor(self):
+        if not hasattr(self, '_zstd_decompressor'):
+            import zstandard
+            self._zstd_decompressor = zstandard.ZstdDecompressor(dict_data=self.zstd_dict)
+        return self._zstd_decompressor
+
+    # ------------------------------ Training ------------------------------- #
+    @staticmethod
+    def train(method, samples, size=32768):
+        """
+        Build a shared dictionary from a sample of values.
+        For zstd we use the real dictionary trainer. zlib has no trainer,
+        but it looks for matches in the last 32 KiB of its dictionary, so
+        we simply keep the end of the concatenated samples.
+        """
+        samples = [s.encode() if isinstance(s, str) else s for s in samples if s]
+        if method == 'zstd':
+            import zstandard
+            return zstandard.train_dictionary(size, samples).as_bytes()
+        return b''.join(samples)[-min(size, 32768):]
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Written by Lucas Sinclair.
+MIT Licensed.
+Contact at www.sinclair.bio
+"""
+
+# Built-in modules #
+import re, gzip
+
+# Internal modules #
+from plumbing.databases.sqlite_database import SQLiteDatabase, infer_sql_type
+
+# Regular expressions #
+re_fields = re.compile(r'/([^\s=/]+)=(?:"([^"]*)"|(\S*))')
+
+################################################################################
+def parse_header(line):
+    """
+    Parse a FASTA header line such as:
+
+        >READ_1 /begin=529 /end=867 /location="Cook's Bay, Moorea"
+
+    Returns the identifier and a dictionary of the `/key=value` fields.
+    Values can be quoted with double quotes to contain spaces.
+    """
+    line  = line.rstrip('\n')
+    ident = line[1:].split(None, 1)[0] if len(line) > 1 else ''
+    return ident, {k: q if v == '' else v for k, q, v in re_fields.findall(line)}
+
+def iterate_fasta(handle):
+    """
+    Yield `(header, sequence)` tuples from an open FASTA file, reading it
+    only once. Sequences spanning several lines are joined.
+    """
+    header, parts = None, []
+    for line in handle:
+        if line.startswith('>'):
+            if header is not None: yield header, ''.join(parts)
+            header, parts = line, []
+        else:
+            parts.append(line.strip())
+    if header is not None: yield header, ''.join(parts)
+
+################################################################################
+def fasta_to_sqlite(source, dest, table='data', exclude=None, types=None,
+                    batch_size=20000, overwrite=False, progress=False):
+    """
+    Ingest a FASTA file with `/key=value` headers into a new SQLite
+    database, with one row per sequence and one column per header key.
+    The file is read a single time:
+
+    * Records are accumulated `batch_size` at a time.
+
+    * Every key not seen before becomes a new column, whose type is inferred
+      from the values present in the batch where it first appears. SQLite
+      then converts the text values to numbers through column affinity.
+
+    * Each batch is inserted with a single `executemany` in one transaction.
+
+    * The index on `id` is built at the very end.
+
+    The other options are:
+
+    * The exclude option is a list of keys to ignore, e.g. `['ip_notice']`.
+
+    * The types option maps keys to SQL types and overrides the inference.
+
+    Returns the `SQLiteDatabase` object. Gzipped files are accepted.
+
+        >>> from plumbing.databases.fasta_ingest import fasta_to_sqlite
+        >>> db = fasta_to_sqlite('reads.fasta', 'reads.db', exclude=['ip_notice'])
+        >>> print(db['JCVI_PEP_1112677232278'])
+    """
+    # Default values #
+    exclude = set(exclude or ())
+    types   = types or {}
+    # Create the database #
+    db = SQLiteDatabase(dest)
+    db.main_table = table
+    db.create(columns={'id': 'text', 'seq': 'text'}, overwrite=overwrite)
+    # Settings for bulk loading #
+    db.own_cursor.execute('PRAGMA synchronous = OFF;')
+    db.own_cursor.execute('PRAGMA journal_mode = MEMORY;')
+    # The columns in order of appearance #
+    keys = []
+    # Display progress #
+    if progress:
+        import tqdm
+        bar = tqdm.tqdm(unit=' reads')
+    # Open the file #
+    opener = gzip.open if str(source).endswith('.gz') else open
+    with opener(str(source), 'rt') as handle:
+        batch = []
+        for header, seq in iterate_fasta(handle):
+            ident, fields = parse_header(header)
+            for key in exclude: fields.pop(key, None)
+            batch.append((ident, seq, fields))
+            if len(batch) < batch_size: continue
+            insert_batch(db, table, batch, keys, types)
+            if progress: bar.update(len(batch))
+            batch = []
+        # The remaining records #
+        if batch: insert_batch(db, table, batch, keys, types)
+    # Close progress #
+    if progress:
+        bar.update(len(batch))
+        bar.close()
+    # Index at the end #
+    db.index('id')
+    db.own_connection.commit()
+    # Return #
+    return db
+
+def insert_batch(db, table, batch, keys, types):
+    """
+    Add the columns that are new in this batch, then insert all its
+    records. The `keys` list is updated in place.
+    """
+    # Find the new keys #
+    known = set(keys)
+    new   = []
+    for ident, seq, fields in batch:
+        for key in fields:
+            if key in known: continue
+            known.add(key)
+            new.append(key)
+    # Add them as columns #
+    for key in new:
+        kind = types.get(key) or infer_sql_type(f.get(key) for i, s, f in batch)
+        db.add_column(key, kind, table=table)
+    keys += new
+    # Insert #
+    columns = ['id', 'seq'] + keys
+    rows    = ((i, s) + tuple(f.get(k) for k in keys) for i, s, f in batch)
+    db.own_cursor.execute('BEGIN;')
+    db.add(rows, table=table, columns=columns)
+    db.own_connection.commit()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Written by Lucas Sinclair.
+MIT Licensed.
+Contact at www.sinclair.bio
+"""
+
+# Built-in modules #
+import os, json, hashlib, tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Constants #
+chunk_size = 64 * 1024 * 1024
+suffix     = '.verified'
+
+################################################################################
+def new_hasher(algo):
+    """
+    Return a new hash object for the algorithm named `algo`. Anything known
+    to `hashlib` works (e.g. 'md5', 'sha256', 'blake2b'), as well as the
+    algorithms of the `xxhash` module when it is installed (e.g. 'xxh64',
+    'xxh3_128'), which are several times faster than MD5.
+    """
+    if algo.startswith('xxh'):
+        import xxhash
+        return getattr(xxhash, algo)()
+    return hashlib.new(algo)
+
+def hash_file(path, algo):
+    """Hash a whole file sequentially and return the hexadecimal digest."""
+    hasher = new_hasher(algo)
+    with open(path, 'rb') as handle:
+        for data in iter(lambda: handle.read(1024*1024), b''): hasher.update(data)
+    return hasher.hexdigest()
+
+def hash_range(path, algo, start, length, block=1024*1024):
+    """Hash `length` bytes of a file starting at the offset `start`."""
+    hasher = new_hasher(algo)
+    with open(path, 'rb') as handle:
+        handle.seek(start)
+        while length > 0:
+            data = handle.read(min(block, length))
+            if not data: break
+            hasher.update(data)
+            length -= len(data)
+    return hasher.digest()
+
+def file_digest(path, algo='md5', threads=None):
+    """
+    Compute the hexadecimal digest of a file.
+
+    If the algorithm name ends with '-parallel' (e.g. 'blake2b-parallel')
+    the file is cut in chunks of 64 MiB that are hashed concurrently in a
+    pool of threads, and the final digest is the hash of the concatenated
+    chunk digests. This is not the same value as the plain algorithm, but
+    it is much faster on large files since hashing releases the GIL.
+    """
+    # Plain sequential hash #
+    if not algo.endswith('-parallel'):
+        return hash_file(path, algo)
+    # Hash the chunks in parallel #
+    algo   = algo[:-len('-parallel')]
+    size   = os.path.getsize(path)
+    starts = range(0, max(size, 1), chunk_size)
+    with ThreadPoolExecutor(threads) as pool:
+        digests = pool.map(lambda s: hash_range(path, algo, s, chunk_size), starts)
+        digests = list(digests)
+    # Combine them #
+    hasher = new_hasher(algo)
+    for digest in digests: hasher.update(digest)
+    return hasher.hexdigest()
+
+################################################################################
+def file_signature(path):
+    """
+    What identifies a given version of a file without reading it. If any
+    of these values change, the file has to be hashed again.
+    """
+    stat = os.stat(path)
+    return {'path':  os.path.abspath(path),
+            'size':  stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'inode': stat.st_ino}
+
+def cached_file_digest(path, algo='md5'):
+    """
+    Same as `file_digest` but the result is remembered in a sidecar file
+    placed next to the original (e.g. 'reads.db.verified'). The digest is
+    only recomputed when the path, size, modification time or inode of the
+    file have changed, or when a different algorithm is requested. If the
+    sidecar cannot be written (read-only directory), nothing is cached.
+    """
+    # Read the cache #
+    path      = str(path)
+    signature = file_signature(path)
+    sidecar   = path + suffix
+    try:
+        with open(sidecar) as handle: cache = json.load(handle)
+    except (OSError, ValueError):
+        cache = {}
+    # Is it valid #
+    digests = cache.get('digests', {}) if cache.get('signature') == signature else {}
+    if algo in digests: return digests[algo]
+    # Compute #
+    digests[algo] = file_digest(path, algo)
+    # Write the cache, atomically since many processes might read it #
+    try:
+        fd, temp = tempfile.mkstemp(prefix=os.path.basename(sidecar) + '.',
+                                    dir=os.path.dirname(os.path.abspath(sidecar)))
+    except OSError:
+        return digests[algo]
+    try:
+        with os.fdopen(fd, 'w') as handle:
+            json.dump({'signature': signature, 'digests': digests}, handle)
+        os.replace(temp, sidecar)
+    except OSError:
+        if os.path.exists(temp): os.remove(temp)
+    # Return #
+    return digests[algo]
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Written by Lucas Sinclair.
+MIT Licensed.
+Contact at www.sinclair.bio
+"""
+
+# Built-in modules #
+import re, time, collections
+
+# Third party modules #
+import pandas
+
+################################################################################
+class QueryProfiler(object):
+    """
+    Records how long every statement issued by an `SQLiteDatabase` takes,
+    how many rows it returned or modified, and the plan chosen by the
+    SQLite query planner. Statements are grouped once their literal values
+    are stripped out, so that `get_entry('A')` and `get_entry('B')` count
+    as the same statement. Plans that scan a whole table are flagged, these
+    are usually the sign of a missing index.
+
+    Use it like this:
+
+        >>> db = SQLiteDatabase('reads.db', profile=True)
+        >>> db.get_entry('JCVI_PEP_1112677232278', column='read_id')
+        >>> print(db.profiler.df)
+        >>> print(db.profiler.slow_df)
+    """
+
+    # Regular expressions used to normalize the statements #
+    re_strings = re.compile(r"'(?:[^']|'')*'")
+    re_numbers = re.compile(r"\b\d+(?:\.\d+)?\b")
+    re_spaces  = re.compile(r"\s+")
+
+    # Only these statements can be explained by the query planner #
+    explainable = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+
+    def __init__(self, slow_threshold=0.1, max_slow=100, explain=True):
+        """
+        * The slow_threshold is in seconds. Any statement taking longer
+          will be kept in the slow-query log.
+
+        * The max_slow option bounds the length of the slow-query log,
+          only the most recent entries are kept.
+
+        * The explain option enables running `EXPLAIN QUERY PLAN` the
+          first time a given statement is seen.
+        """
+        self.slow_threshold = slow_threshold
+        self.max_slow       = max_slow
+        self.explain        = explain
+        self.reset()
+
+    def __repr__(self):
+        msg = '<%s object with %i distinct statements>'
+        return msg % (self.__class__.__name__, len(self.stats))
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        self.stats = collections.OrderedDict()
+        self.slow  = collections.deque(maxlen=self.max_slow)
+
+    def normalize(self, sql):
+        """Replace literal values with question marks and collapse spaces."""
+        sql = self.re_strings.sub('?', sql)
+        sql = self.re_numbers.sub('?', sql)
+        return self.re_spaces.sub(' ', sql).strip()
+
+    def get_plan(self, connection, sql, params=()):
+        """Ask the query planner how it would run a statement."""
+        if not sql.lstrip().upper().startswith(self.explainable): return None
+        cursor = connection.cursor()
+        cursor.row_factory = None
+        try: rows = cursor.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+        except Exception: return None
+        finally: cursor.close()
+        return '; '.join(row[-1] for row in rows)
+
+    @staticmethod
+    def is_full_scan(plan):
+        """
+        Does the plan read every row of a table? Recent SQLite versions
+        write `SCAN data` and older ones `SCAN TABLE data`, while index
+        lookups appear as `SEARCH` or `SCAN ... USING INDEX`.
+        """
+        if plan is None: return False
+        for step in plan.split('; '):
+            if not step.startswith('SCAN '):       continue
+            if 'USING' in step:                     continue
+            if step.startswith('SCAN CONSTANT ROW'): continue
+            return True
+        return False
+
+    def record(self, connection, sql, params, seconds, rows):
+        """Add one execution of a statement to the statistics."""
+        # Find the group #
+        key   = self.normalize(sql)
+        stats = self.stats.get(key)
+        # First time we see it #
+        if stats is None:
+            plan  = self.get_plan(connection, sql, params) if self.explain else None
+            stats = {'statement': key,
+                     'calls':     0,
+                     'total':     0.0,
+                     'max':       0.0,
+                     'rows':      0,
+                     'plan':      plan,
+                     'full_scan': self.is_full_scan(plan)}
+            self.stats[key] = stats
+        # Update #
+        stats['calls'] += 1
+        stats['total'] += seconds
+        stats['max']    = max(stats['max'], seconds)
+        if rows is not None and rows >= 0: stats['rows'] += rows
+        # Slow query log #
+        if seconds >= self.slow_threshold:
+            self.slow.append({'time':      time.time(),
+                              'statement': sql,
+                              'seconds':   seconds,
+                              'rows':      rows,
+                              'full_scan': stats['full_scan']})
+
+    @property
+    def df(self):
+        """
+        One row per distinct statement, the slowest in total first.
+        Statements marked as `full_scan` are candidates for a new index.
+        """
+        columns = ['statement', 'calls', 'total', 'mean', 'max',
+                   'rows', 'full_scan', 'plan']
+        df = pandas.DataFrame(list(self.stats.values()))
+        if df.empty: return pandas.DataFrame(columns=columns)
+        df['mean'] = df['total'] / df['calls']
+        return df[columns].sort_values('total', ascending=False, ignore_index=True)
+
+    @property
+    def slow_df(self):
+        """The most recent slow statements, with their actual literals."""
+        columns = ['time', 'statement', 'seconds', 'rows', 'full_scan']
+        return pandas.DataFrame(list(self.slow), columns=columns)
+
+    @property
+    def full_scans(self):
+        """The distinct statements that read an entire table."""
+        return [s['statement'] for s in self.stats.values() if s['full_scan']]
+
+###############################################################################
+class ProfiledCursor(object):
+    """
+    Stands in for the `sqlite3.Cursor` of a `SELECT` issued through
+    `SQLiteDatabase.execute`, since the rows are only produced as they
+    are fetched. The time spent fetching and the number of rows are added
+    to the time of the first step, and reported once all rows were read,
+    or when the cursor is closed or discarded.
+    """
+
+    def __init__(self, cursor, report, seconds):
+        self.cursor  = cursor
+        self.report  = report
+        self.seconds = seconds
+        self.rows    = 0
+        self.done    = False
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None: return
+            yield row
+
+    def __del__(self):
+        self.finish()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row   = self.cursor.fetchone()
+        self.seconds += time.perf_counter() - start
+        if row is None: self.finish()
+        else:           self.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        if size is None: size = self.cursor.arraysize
+        start = time.perf_counter()
+        rows  = self.cursor.fetchmany(size)
+        self.seconds += time.perf_counter() - start
+        self.rows    += len(rows)
+        if len(rows) < size: self.finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows  = self.cursor.fetchall()
+        self.seconds += time.perf_counter() - start
+        self.rows    += len(rows)
+        self.finish()
+        return rows
+
+    def close(self):
+        self.finish()
+        self.cursor.close()
+
+    def finish(self):
+        """Report to the profiler, only once."""
+        if self.done: return
+        self.done = True
+        self.report(self.seconds, self.rows)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Written by Lucas Sinclair.
+MIT Licensed.
+Contact at www.sinclair.bio
+"""
+
+# Built-in modules #
+import re, sys, collections
+
+################################################################################
+class ResultCache(object):
+    """
+    Keeps the results of recent queries in memory, least recently used
+    entries being evicted first once either the number of entries or
+    their estimated total size goes over the limits.
+
+    Every entry remembers the version of the database it was computed
+    from. An entry whose version differs from the current one is never
+    returned, so any write forces a fresh read.
+    """
+
+    re_spaces = re.compile(r"\s+")
+
+    def __init__(self, max_entries=256, max_bytes=256*1024*1024):
+        self.max_entries = max_entries
+        self.max_bytes   = max_bytes
+        self.clear()
+
+    def __repr__(self):
+        msg = '<%s object with %i entries, %i hits and %i misses>'
+        return msg % (self.__class__.__name__, len(self.entries), self.hits, self.misses)
+
+    def __len__(self): return len(self.entries)
+
+    def clear(self):
+        """Forget everything."""
+        self.entries = collections.OrderedDict()
+        self.size    = 0
+        self.hits    = 0
+        self.misses  = 0
+
+    def make_key(self, sql, params=(), *extra):
+        """The SQL with normalized spaces, the parameters, and anything else."""
+        if isinstance(params, dict): params = tuple(sorted(params.items()))
+        else:                        params = tuple(params)
+        return (self.re_spaces.sub(' ', sql).strip(), params) + extra
+
+    def get(self, key, version):
+        """Return the cached value or `None` if missing or outdated."""
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != version:
+            if entry is not None: self.remove(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, version, value, size):
+        """Store a value computed at a given database version."""
+        if size > self.max_bytes: return
+        if key in self.entries: self.remove(key)
+        self.entries[key] = (version, value, size)
+        self.size += size
+        # Evict the oldest #
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        version, value, size = self.entries.pop(key)
+        self.size -= size
+
+    @staticmethod
+    def size_of_rows(rows):
+        """A rough estimate of the memory taken by a list of rows."""
+        size = sys.getsizeof(rows)
+        for row in rows:
+            size += sys.getsizeof(row)
+            try: size += sum(sys.getsizeof(v) for v in row)
+            except TypeError: pass
+        return size
+
+###############################################################################
+class CachedCursor(object):
+    """
+    Stands in for an `sqlite3.Cursor` when the rows of a query come from
+    the cache. Supports the usual fetching methods and iteration.
+    """
+
+    def __init__(self, rows, description):
+        self.rows        = rows
+        self.description = description
+        self.rowcount    = -1
+        self.position    = 0
+
+    def __iter__(self):
+        while self.position < len(self.rows): yield self.fetchone()
+
+    def fetchone(self):
+        if self.position >= len(self.rows): return None
+        self.position += 1
+        return self.rows[self.position - 1]
+
+    def fetchmany(self, size=1):
+        result = self.rows[self.position:self.position + size]
+        self.position += len(result)
+        return result
+
+    def fetchall(self):
+        result = self.rows[self.position:]
+        self.position = len(self.rows)
+        return result
+
+    def close(self): pass
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Written by Lucas Sinclair.
+MIT Licensed.
+Contact at www.sinclair.bio
+"""
+
+# Built-in modules #
+import zlib, multiprocessing
+
+# Internal modules #
+from plumbing.databases.sqlite_database import SQLiteDatabase
+
+# First party modules #
+from autopaths.dir_path import DirectoryPath
+
+# Third party modules #
+import pandas
+
+################################################################################
+class ShardedDatabase(object):
+    """
+    A table partitioned across several SQLite3 files by hashing the value
+    of a key column. Since SQLite has a single writer lock per file, this
+    lets several processes insert concurrently, as long as each one writes
+    to its own shard. Lookups on the key are routed to the right shard,
+    while scans and aggregates are fanned out to all shards with a pool
+    of processes and merged afterwards.
+
+    Use it like this:
+
+        >>> from plumbing.databases.sharded_database import ShardedDatabase
+        >>> db = ShardedDatabase('/tmp/reads/', num_shards=8)
+        >>> db.create({'id': 'text', 'length': 'integer'})
+        >>> db.add([('read_1', 250), ('read_2', 300)])
+        >>> print(db['read_2'])
+        >>> print(db.aggregate(by='length', funcs={'id': 'count'}))
+    """
+
+    # The shard files will be named like this #
+    shard_name = "shard_%03i.sqlite"
+
+    def __init__(self, directory, num_shards, key='id', processes=None, **kwargs):
+        """
+        * The directory in which the shard files are placed comes first.
+
+        * The number of shards. It must never change once data is added.
+
+        * The key option is the column used to route the entries.
+
+        * The processes option is the size of the pool used for fan-out
+          queries. Defaults to the number of CPUs.
+
+        * Any other keyword argument is passed to every `SQLiteDatabase`.
+        """
+        self.directory  = DirectoryPath(directory)
+        self.num_shards = num_shards
+        self.key        = key
+        self.processes  = processes
+        self.kwargs     = kwargs
+        # One object per shard #
+        self.shards = [SQLiteDatabase(self.directory + self.shard_name % i, **kwargs)
+                       for i in range(num_shards)]
+
+    def __repr__(self):
+        """Called when evaluating ``print(database)``."""
+        msg = '<%s object with %i shards in "%s">'
+        return msg % (self.__class__.__name__, self.num_shards, self.directory)
+
+    def __enter__(self):
+        """Called when entering the 'with' statement."""
+        return self
+
+    def __exit__(self, errtype, value, traceback):
+        """Called when exiting the 'with' statement."""
+        self.close()
+
+    def __iter__(self):
+        """Called when evaluating ``for x in database: pass``."""
+        for shard in self.shards:
+            for entry in shard: yield entry
+
+    def __contains__(self, key):
+        """Called when evaluating ``"P81239A" in database``."""
+        return key in self.shard_for(key)
+
+    def __len__(self):
+        """Called when evaluating ``len(database)``."""
+        return self.count_entries()
+
+    def __getitem__(self, key):
+        """Called when evaluating ``database['P81239A']``."""
+        return self.get_entry(key)
+
+    # ------------------------------ Properties ----------------------------- #
+    @property
+    def main_table(self):
+        """The table that is partitioned, same in every shard."""
+        return self.shards[0].main_table
+
+    @property
+    def paths(self):
+        """The paths to all the shard files."""
+        return [str(shard.path) for shard in self.shards]
+
+    # ------------------------------- Routing ------------------------------- #
+    def shard_number(self, key):
+        """
+        The number of the shard that holds a given key. We cannot use the
+        built-in `hash()` since it is salted differently in every process.
+        """
+        return zlib.crc32(str(key).encode()) % self.num_shards
+
+    def shard_for(self, key):
+        """The `SQLiteDatabase` object that holds a given key."""
+        return self.shards[self.shard_number(key)]
+
+    # ------------------------------- Writing ------------------------------- #
+    def create(self, columns, type_map=None, overwrite=False):
+        """Create every shard with the same schema."""
+        self.directory.create_if_not_exists()
+        for shard in self.shards:
+            shard.create(columns=columns, type_map=type_map, overwrite=overwrite)
+            shard.own_connection.commit()
+
+    def add(self, entries, columns=None, batch_size=10000):
+        """
+        Add entries to the main table, routing each of them to its shard.
+        Entries are buffered per shard and inserted `batch_size` at a time.
+
+        To avoid lock contention when writing from several processes, each
+        process should rather call `shard.add()` on its own shard directly,
+        using `shard_number()` to split its input beforehand.
+        """
+        # Where is the key in every entry #
+        if columns is None: columns = self.shards[0].columns
+        position = list(columns).index(self.key)
+        # One buffer per shard #
+        buffers = [[] for _ in self.shards]
+        # Main loop #
+        for entry in entries:
+            number = self.shard_number(entry[position])
+            buffers[number].append(entry)
+            if len(buffers[number]) < batch_size: continue
+            self.flush(number, buffers[number], columns)
+            buffers[number] = []
+        # The remainders #
+        for number, buffer in enumerate(buffers):
+            if buffer: self.flush(number, buffer, columns)
+
+    def flush(self, number, entries, columns):
+        """Insert a batch of entries in one shard and commit."""
+        shard = self.shards[number]
+        shard.add(entries, columns=columns)
+        shard.own_connection.commit()
+
+    def index(self, column=None):
+        """Create the same index in every shard."""
+        if column is None: column = self.key
+        for shard in self.shards:
+            shard.index(column=column)
+            shard.own_connection.commit()
+
+    def close(self):
+        for shard in self.shards:
+            if '__cache__' in shard.__dict__: shard.close()
+
+    # ------------------------------- Reading ------------------------------- #
+    def get_entry(self, key):
+        """Get a specific entry by looking only in the right shard."""
+        return self.shard_for(key).get_entry(key, column=self.key)
+
+    def map_shards(self, func, *args):
+        """
+        Call `func(path, *args)` on every shard file in a pool of processes
+        and return the list of results, in the order of the shards. The
+        function has to be importable (i.e. defined at the module level)
+        and should open its own connection to the path it receives.
+        """
+        tasks = [(func, path) + args for path in self.paths]
+        with multiprocessing.Pool(self.processes) as pool:
+            return pool.map(call_on_shard, tasks)
+
+    def query_df(self, query, params=()):
+        """
+        Run the same SELECT query on every shard in parallel and return
+        the concatenation of the results as one dataframe.
+        """
+        frames = self.map_shards(query_shard, query, params)
+        return pandas.concat(frames, ignore_index=True)
+
+    def read_df(self, columns=None, where=None):
+        """Read the main table of every shard in parallel as one dataframe."""
+        query = self.shards[0].select_query(self.main_table, columns, where)
+        return self.query_df(query)
+
+    def count_entries(self):
+        """How many rows in total, counted in parallel."""
+        query = 'SELECT COUNT(1) AS count FROM "%s";' % self.main_table
+        return int(self.query_df(query)['count'].sum())
+
+    def aggregate(self, by, funcs, where=None):
+        """
+        Compute a `GROUP BY` over all shards. Every shard computes partial
+        aggregates in parallel, and those are then combined.
+
+        * The by option is a column name or a list of column names.
+
+        * The funcs option maps column names to one of 'count', 'sum',
+          'min', 'max' or 'avg'.
+        """
+        # Checks #
+        if isinstance(by, str): by = [by]
+        unknown = set(funcs.values()) - set(self.combiners)
+        if unknown: raise Exception("Unsupported aggregates: %s" % unknown)
+        # The partial aggregates, the average needs a sum and a count #
+        parts = []
+        for col, func in funcs.items():
+            if func == 'avg':
+                parts.append('SUM("%s") AS "%s__sum"' % (col, col))
+                parts.append('COUNT("%s") AS "%s__count"' % (col, col))
+            else:
+                parts.append('%s("%s") AS "%s"' % (func.upper(), col, col))
+        # The query #
+        group = ','.join('"' + c + '"' for c in by)
+        query = 'SELECT %s,%s FROM "%s"' % (group, ','.join(parts), self.main_table)
+        if where is not None: query += ' WHERE %s' % where
+        query += ' GROUP BY %s;' % group
+        # Run it #
+        partials = self.query_df(query)
+        # Combine the partial results #
+        combine = {}
+        for col, func in funcs.items():
+            if func == 'avg':
+                combine[col + '__sum']   = 'sum'
+                combine[col + '__count'] = 'sum'
+            else:
+                combine[col] = self.combiners[func]
+        # Like in SQL, the NULL values form a group of their own #
+        result = partials.groupby(by, as_index=False, dropna=False).agg(combine)
+        # Finish the averages #
+        for col, func in funcs.items():
+            if func != 'avg': continue
+            result[col] = result.pop(col + '__sum') / result.pop(col + '__count')
+        # Return #
+        return result
+
+    # How partial aggregates are combined together #
+    combiners = {'count': 'sum',
+                 'sum':   'sum',
+                 'min':   'min',
+                 'max':   'max',
+                 'avg':   None}
+
+###############################################################################
+def call_on_shard(task):
+    """Unpack a task for `multiprocessing.Pool.map`."""
+    func, path, args = task[0], task[1], task[2:]
+    return func(path, *args)
+
+def query_shard(path, query, params=()):
+    """Run a query on a shard file and return the result as a dataframe."""
+    db = SQLiteDatabase(path)
+    try:
+        cursor = db.own_connection.cursor()
+        cursor.row_factory = None
+        cursor.execute(query, params)
+        names = [x[0] for x in cursor.description]
+        return pandas.DataFrame.from_records(cursor.fetchall(), columns=names)
+    finally:
+        db.close()
@@ -1,25 +1,54 @@
 # Built-in modules #
-import os, sqlite3, types
+import os, re, json, sqlite3, types, time, math, random, urllib.parse, multiprocessing
+import threading, itertools, numbers, weakref
 
 # Internal modules #
 from plumbing.color      import Color
 from plumbing.cache      import property_cached
 from plumbing.scraping   import download_from_url
+from plumbing.databases.query_profiler import QueryProfiler, ProfiledCursor
+from plumbing.databases.integrity import cached_file_digest
+from plumbing.databases.compression import ColumnCodec, meta_table
+from plumbing.databases.result_cache import ResultCache, CachedCursor
 from autopaths.file_path import FilePath
 
 # Third party modules #
 import pandas
 
+################################################################################
+class connection_cached(property_cached):
+    """
+    Same as `property_cached` but for the connections and cursors of an
+    `SQLiteDatabase`. When the database has an idle timeout, every access
+    is timed and holds the lock, so that the timer never closes a
+    connection that is just being handed out.
+    """
+
+    def __get__(self, instance, owner):
+        if instance is None or instance.lock is None:
+            return property_cached.__get__(self, instance, owner)
+        with instance.lock:
+            instance.last_used = time.monotonic()
+            return property_cached.__get__(self, instance, owner)
+
 ################################################################################
 class SQLiteDatabase(FilePath):
     """A wrapper for an SQLite3 database."""
 
+    # How many rows are fetched at a time when building dataframes #
+    read_chunk_size = 50000
+
     def __init__(self, path,
-                       factory   = None,
-                       text_fact = None,
-                       isolation = None,
-                       retrieve  = None,
-                       known_md5 = None):
+                       factory    = None,
+                       text_fact  = None,
+                       isolation  = None,
+                       retrieve   = None,
+                       known_md5  = None,
+                       known_hash = None,
+                       profile    = False,
+                       readonly   = False,
+                       cache      = False,
+                       idle       = None):
         """
         * The path of the database comes first.
 
@@ -35,14 +64,52 @@ class SQLiteDatabase(FilePath):
           if it was not found at the `path` given.
 
         * The md5 option is used to check the integrity of a database.
+
+        * The known_hash option does the same with another algorithm, it is
+          written as 'algorithm:digest', e.g. 'blake2b:8f3a...'. See the
+          `plumbing.databases.integrity` module for the possible algorithms.
+          In both cases the digest is cached next to the database and only
+          recomputed when the file changes.
+
+        * The profile option will record the timing and query plan of the
+          statements issued through `execute`, `get_entry`, `add` and
+          `read_df`. See the `profiler` attribute afterwards.
+
+        * The readonly option opens the file with `mode=ro&immutable=1`.
+          SQLite then takes no locks and never looks for a journal, so many
+          processes can open the same file (e.g. on NFS) at almost no cost
+          and share the OS page cache. The file must not be modified by
+          anyone while it is opened this way. The header check is skipped.
+
+        * The cache option keeps the results of the SELECT statements issued
+          through `execute` and `read_df` in memory. They are discarded as
+          soon as the database is modified, by us or any other process.
+          See the `result_cache` attribute to change the limits.
+
+        * The idle option is a number of seconds after which the connections
+          are closed if they were not used, releasing the file handles and
+          the page cache. They are reopened transparently on next use.
+          They are never closed while a transaction is pending or while a
+          cursor returned by iterating, such as `for row in database` or
+          `iter_df()`, is still in use.
         """
-        self.path      = path
-        self.text_fact = text_fact
-        self.factory   = factory
-        self.isolation = isolation
-        self.retrieve  = retrieve
-        self.known_md5 = known_md5
-        self.prepared  = False
+        self.path         = path
+        self.text_fact    = text_fact
+        self.factory      = factory
+        self.isolation    = isolation
+        self.retrieve     = retrieve
+        self.known_md5    = known_md5
+        self.known_hash   = known_hash
+        self.prepared     = False
+        self.profiler     = QueryProfiler() if profile else None
+        self.readonly     = readonly
+        self.codecs       = None
+        self.result_cache = ResultCache() if cache else None
+        self.idle         = idle
+        self.idle_timer   = None
+        self.last_used    = None
+        self.lock         = threading.RLock() if idle else None
+        self.open_cursors = weakref.WeakSet()
 
     def __repr__(self):
         """Called when evaluating ``print(database)``."""
@@ -62,7 +129,7 @@ class SQLiteDatabase(FilePath):
 
     def __iter__(self):
         """Called when evaluating ``for x in database: pass``."""
-        new_cursor = self.own_connection.cursor()
+        new_cursor = self.open_cursor(self.main_table)
         new_cursor.execute('SELECT * from "%s";' % self.main_table)
         return new_cursor
 
@@ -77,30 +144,35 @@ class SQLiteDatabase(FilePath):
         return self.count_entries()
 
     def __bool__(self):
-        """Called when evaluating ``if database: pass``."""
-        return True if len(self) != 0 else False
+        """
+        Called when evaluating ``if database: pass``.
+        Stops at the first row found instead of counting them all.
+        """
+        command = 'SELECT EXISTS(SELECT 1 FROM "%s" LIMIT 1);'
+        self.own_cursor.execute(command % self.main_table)
+        return bool(self.own_cursor.fetchone()[0])
 
     def __getitem__(self, key):
         """Called when evaluating ``database[0] or database['P81239A']``."""
         return self.get_entry(key)
 
     # ------------------------------ Properties ----------------------------- #
-    @property_cached
+    @connection_cached
     def connection(self):
         """To be used externally by the user."""
         return self.new_connection()
 
-    @property_cached
+    @connection_cached
     def own_connection(self):
         """To be used internally in the methods of this class."""
         return self.new_connection()
 
-    @property_cached
+    @connection_cached
     def cursor(self):
         """To be used externally by the user."""
         return self.connection.cursor()
 
-    @property_cached
+    @connection_cached
     def own_cursor(self):
         """To be used internally in the methods of this class."""
         return self.own_connection.cursor()
@@ -108,12 +180,10 @@ class SQLiteDatabase(FilePath):
     @property
     def tables(self):
         """The complete list of SQL tables."""
-        self.own_connection.row_factory = sqlite3.Row
-        query = 'SELECT name from sqlite_master where type="table";'
-        self.own_cursor.execute(query)
-        result = [x[0].encode('ascii') for x in self.own_cursor.fetchall()]
-        self.own_connection.row_factory = self.factory
-        return result
+        cursor = self.own_connection.cursor()
+        cursor.row_factory = None
+        query  = 'SELECT name from sqlite_master where type="table";'
+        return [x[0] for x in cursor.execute(query).fetchall()]
 
     @property_cached
     def main_table(self):
@@ -137,16 +207,28 @@ class SQLiteDatabase(FilePath):
 
     @property
     def df(self):
-        """The main table as a pandas dataframe."""
-        pass
+        """
+        The main table as a pandas dataframe. Nothing is read until the
+        property is accessed, and it is read again at every access.
+        """
+        return self.read_df()
 
     # ------------------------------- Methods ------------------------------- #
     def new_connection(self):
         """Make a new connection and return it."""
         # Check different things #
         if not self.prepared: self.prepare()
+        # The idle timer closes connections from another thread #
+        same_thread = self.idle is None
         # Open connection #
-        con = sqlite3.connect(self.path, isolation_level=self.isolation)
+        if self.readonly:
+            con = sqlite3.connect(self.uri, uri=True, isolation_level=self.isolation,
+                                  check_same_thread=same_thread)
+        else:
+            con = sqlite3.connect(self.path, isolation_level=self.isolation,
+                                  check_same_thread=same_thread)
+        # Start watching #
+        if self.idle and self.idle_timer is None: self.start_idle_timer()
         # Set the factory #
         if self.factory: con.row_factory = self.factory
         # Set the text factory #
@@ -154,6 +236,12 @@ class SQLiteDatabase(FilePath):
         # Return #
         return con
 
+    @property
+    def uri(self):
+        """The URI used to open the file in read-only immutable mode."""
+        path = urllib.parse.quote(os.path.abspath(str(self.path)))
+        return 'file:%s?mode=ro&immutable=1' % path
+
     def prepare(self):
         """
         Check that the file exists, optionally downloads it.
@@ -168,13 +256,26 @@ class SQLiteDatabase(FilePath):
             else:
                 msg = "The file '" + self.path + "' does not exist."
                 raise Exception(msg)
-        # Check the file header #
-        self.check_format()
-        # Check the MD5 #
-        if self.known_md5: assert self.known_md5 == self.md5
+        # Check the file header, SQLite will complain anyway if it's wrong #
+        if not self.readonly: self.check_format()
+        # Check the MD5 or other digest #
+        if self.known_md5 or self.known_hash: self.verify()
         # Set attribute to True #
         self.prepared = True
 
+    def verify(self):
+        """
+        Check the file against `known_md5` or `known_hash`. The digest is
+        cached in a sidecar file so that it is only recomputed when the
+        size, modification time or inode of the database change.
+        """
+        if self.known_hash: algo, expected = self.known_hash.split(':', 1)
+        else:               algo, expected = 'md5', self.known_md5
+        digest = cached_file_digest(self.path, algo)
+        if digest != expected.lower():
+            msg = "The file '%s' has the %s digest '%s' instead of '%s'."
+            raise Exception(msg % (self.path, algo, digest, expected))
+
     def check_format(self):
         if self.count_bytes == 0: return
         with open(self.path, 'rb') as f: header = f.read(15)
@@ -182,39 +283,196 @@ class SQLiteDatabase(FilePath):
             msg = "The file '" + self.path + "' is not an SQLite database."
             raise Exception(msg)
 
-    def create(self, columns=None, type_map=None, overwrite=False):
-        """Create a new database with a certain schema."""
+    def create(self, columns=None, type_map=None, overwrite=False, compress=None,
+               strict=False):
+        """
+        Create a new database with a certain schema.
+        See `add_table()` for the compress and strict options.
+        """
         # Check already exists #
         if self.count_bytes > 0:
             if overwrite: self.remove()
             else: raise Exception("File exists already at '%s'" % self)
-        # If we want it empty #
-        if columns is None:
-            self.touch()
+        # Create the empty file #
+        self.touch()
         # Make the table #
-        else:
-            self.add_table(self.main_table, columns=columns, type_map=type_map)
+        if columns is not None:
+            self.add_table(self.main_table, columns=columns, type_map=type_map,
+                           compress=compress, strict=strict)
 
-    def add_table(self, name, columns, type_map=None, if_not_exists=False):
+    def add_table(self, name, columns, type_map=None, if_not_exists=False,
+                  compress=None, strict=False):
         """
         Add add a new table to the database. For instance you could do this:
 
             >>> data = {'id': 'integer', 'source': 'text', 'pubmed': 'integer'}
             >>> self.add_table('data', data)
+
+        The compress option is a list of text columns that will be stored
+        compressed with zlib, or a dictionary mapping columns to 'zlib' or
+        'zstd'. The values are compressed in `add()` and decompressed when
+        the rows are read through the methods that know their table, such
+        as `get_entry()`, `read_df()` or iterating over the database. Your
+        own queries via `execute()` return them as BLOBs, see `get_codecs()`.
+        Don't compress the columns you search on, see `set_compression()`.
+
+        The type_map option maps column names to SQL types, for when the
+        columns are given as a list. Columns without a type are 'text'.
+
+        The strict option declares a `STRICT` table, in which SQLite refuses
+        values that cannot be converted to the type of their column. The
+        types are then reduced to INTEGER, REAL, TEXT, BLOB or ANY.
         """
         # Check types mapping #
-        if type_map is None and isinstance(columns, dict): types = columns
-        if type_map is None:                               types = {}
+        if type_map is None and isinstance(columns, dict): type_map = columns
+        types = dict(type_map or {})
         # Safe or unsafe #
-        if if_not_exists: query = 'CREATE TABLE IF NOT EXISTS "%s" (%s);'
-        else:             query = 'CREATE table "%s" (%s);'
+        if if_not_exists: query = 'CREATE TABLE IF NOT EXISTS "%s" (%s)'
+        else:             query = 'CREATE table "%s" (%s)'
+        # Compressed columns are stored as BLOBs #
+        if compress is not None and not isinstance(compress, dict):
+            compress = {c: 'zlib' for c in compress}
+        if compress is not None: types.update({c: 'blob' for c in compress})
+        # Strict tables only accept a few types #
+        if strict:
+            if sqlite3.sqlite_version_info < (3,37,0):
+                raise Exception("STRICT tables need SQLite 3.37 or later.")
+            types  = {c: strict_type(types.get(c, 'text')) for c in columns}
+            query += ' STRICT'
         # Do it #
         cols = ','.join(['"' + c + '"' + ' ' + types.get(c, 'text') for c in columns])
-        self.own_cursor.execute(query % (self.main_table, cols))
+        self.own_cursor.execute(query % (name, cols) + ';')
+        # Declare the compression #
+        for column, method in (compress or {}).items():
+            self.set_compression(column, method, table=name)
+
+    def infer_types(self, data, columns=None, sample=1000):
+        """
+        Guess the SQL type of every column from the first `sample` rows of
+        an iterable of tuples, or of a dataframe. Returns the dictionary of
+        types and an iterator giving back all the rows, including the ones
+        that were looked at, so that a generator can still be inserted after.
+
+            >>> types, rows = db.infer_types(generator, ['id', 'length'])
+            >>> db.add_table('reads', types)
+            >>> db.add(rows, table='reads')
+        """
+        # Dataframes have their own dtypes #
+        if isinstance(data, pandas.DataFrame):
+            columns = [str(c) for c in data.columns]
+            types   = {}
+            for name, col in zip(columns, data.columns):
+                kind = sql_type_of(data[col].dtype)
+                if kind == 'text':
+                    kind = infer_sql_type(series_to_python(data[col].iloc[:sample]))
+                types[name] = kind
+            step = max(1, sample)
+            rows = (row for start in range(0, len(data), step)
+                        for row in df_to_python(data.iloc[start:start+step]))
+            return types, rows
+        # Other iterables need to be given column names #
+        if columns is None: raise Exception("The names of the columns are needed.")
+        iterator = iter(data)
+        head     = list(itertools.islice(iterator, sample))
+        values   = list(zip(*head)) or [()] * len(columns)
+        types    = {c: infer_sql_type(v) for c, v in zip(columns, values)}
+        # Put the sampled rows back in front #
+        return types, itertools.chain(head, iterator)
+
+    def add_table_from(self, name, data, columns=None, sample=1000, types=None,
+                       strict=False, compress=None):
+        """
+        Create a table with types inferred from the data it will contain,
+        then insert all of that data in a single transaction. The data can
+        be an iterable of tuples along with the `columns`, or a dataframe.
+        See `infer_types()`.
+
+        * The types option maps column names to SQL types, it overrides
+          the inferred ones.
+
+        * See `add_table()` for the strict and compress options.
+
+        Returns the types chosen.
+        """
+        # Infer #
+        inferred, rows = self.infer_types(data, columns, sample)
+        if types is not None: inferred.update(types)
+        columns = list(inferred)
+        # Create #
+        self.add_table(name, columns, type_map=inferred, strict=strict,
+                       compress=compress)
+        # Insert #
+        if self.own_connection.in_transaction: self.own_connection.commit()
+        self.own_cursor.execute('BEGIN;')
+        self.add(rows, table=name, columns=columns)
+        self.own_connection.commit()
+        # Return #
+        return inferred
+
+    def get_column_types(self, table=None):
+        """
+        Return a dictionary mapping every column of a table to its
+        declared SQL type, e.g. `{'id': 'text', 'length': 'integer'}`.
+        """
+        if table is None: table = self.main_table
+        # The table-valued function avoids issuing a real PRAGMA #
+        query  = 'SELECT name, type FROM pragma_table_info(?);'
+        cursor = self.own_connection.cursor()
+        cursor.row_factory = None
+        return dict(cursor.execute(query, (table,)).fetchall())
 
     def execute(self, *args, **kwargs):
-        """Convenience shortcut."""
-        return self.cursor.execute(*args, **kwargs)
+        """
+        Convenience shortcut. When the result cache is enabled, SELECT
+        statements return a cursor-like object already holding all rows.
+        When profiling, they return a cursor-like object that reports the
+        rows and the time spent fetching them once they were all read.
+        """
+        # Simple case #
+        cache = self.result_cache
+        if self.profiler is None and cache is None:
+            return self.cursor.execute(*args, **kwargs)
+        # The parameters #
+        params = args[1] if len(args) > 1 else kwargs.get('parameters', ())
+        # Check the cache #
+        cacheable = cache is not None and is_select(args[0])
+        if cacheable:
+            key     = cache.make_key(args[0], params, 'execute')
+            version = self.cache_version
+            hit     = cache.get(key, version)
+            if hit is not None: return CachedCursor(*hit)
+        # Execute #
+        start  = time.perf_counter()
+        result = self.cursor.execute(*args, **kwargs)
+        # Store in the cache, unless a rollback could still undo what we see #
+        if cacheable and not self.in_transaction:
+            rows = result.fetchall()
+            self.log_query(args[0], params, time.perf_counter() - start, len(rows))
+            cache.put(key, version, (rows, result.description), cache.size_of_rows(rows))
+            return CachedCursor(rows, result.description)
+        # The rows of a query are only counted as they are fetched #
+        if self.profiler is not None and is_select(args[0]):
+            report = lambda seconds, rows: self.log_query(args[0], params, seconds, rows)
+            return ProfiledCursor(result, report, time.perf_counter() - start)
+        # Return #
+        self.log_query(args[0], params, time.perf_counter() - start, result.rowcount)
+        return result
+
+    @property
+    def cache_version(self):
+        """
+        A value that changes whenever the database might have changed:
+        the `data_version`, the changes made by both of our connections,
+        and the modification time of the file.
+        """
+        changes = self.connection.total_changes
+        return self.data_version + (changes, os.stat(self.path).st_mtime_ns)
+
+    def log_query(self, sql, params, seconds, rows=None):
+        """Report a statement that was just executed to the profiler."""
+        if self.profiler is None: return
+        if rows is not None and rows < 0: rows = None
+        self.profiler.record(self.own_connection, sql, params, seconds, rows)
 
     def get_columns_of_table(self, table=None):
         """
@@ -238,6 +496,11 @@ class SQLiteDatabase(FilePath):
         # Default table and columns #
         if table is None:   table   = self.main_table
         if columns is None: columns = self.get_columns_of_table(table)
+        # Transparent compression #
+        codecs = self.get_codecs(table)
+        if codecs:
+            codecs  = [(i, codecs[c]) for i,c in enumerate(columns) if c in codecs]
+            entries = (compress_entry(entry, codecs) for entry in entries)
         # Default columns #
         question_marks = ','.join('?' for c in columns)
         cols           = ','.join('"' + c + '"' for c in columns)
@@ -249,8 +512,11 @@ class SQLiteDatabase(FilePath):
         errors += (sqlite3.IntegrityError, sqlite3.InterfaceError, ValueError)
         # Do it #
         try:
+            start      = time.perf_counter()
             new_cursor = self.own_connection.cursor()
             new_cursor.executemany(sql_command, entries)
+            self.log_query(sql_command, (), time.perf_counter() - start,
+                           new_cursor.rowcount)
         except errors as err:
             raise Exception(self.detailed_error(sql_command, columns, entries, err))
         except KeyboardInterrupt as err:
@@ -292,40 +558,356 @@ class SQLiteDatabase(FilePath):
         for entries in entries_by_step: self.add(entries, table=table, columns=columns)
 
     def count_entries(self, table=None):
-        """How many rows in a table."""
+        """
+        How many rows in a table. Counting requires a full scan, so the
+        result is remembered until the database changes, either through
+        our own connection or through any other one (`PRAGMA data_version`).
+        Counts taken during a transaction are not remembered since it
+        might be rolled back. If `maintain_count()` was called for this
+        table, the count is read from the counter table instead.
+        """
         if table is None: table = self.main_table
-        self.own_cursor.execute('SELECT COUNT(1) FROM "%s";' % table)
-        return int(self.own_cursor.fetchone()[0])
+        # Check the cache #
+        version = self.data_version
+        cached  = self.count_cache.get(table)
+        if cached is not None and cached[0] == version: return cached[1]
+        # Use the maintained counter if there is one #
+        count = self.get_maintained_count(table)
+        # Otherwise count them #
+        if count is None:
+            self.own_cursor.execute('SELECT COUNT(1) FROM "%s";' % table)
+            count = int(self.own_cursor.fetchone()[0])
+        # Update the cache #
+        if not self.in_transaction: self.count_cache[table] = (version, count)
+        return count
+
+    @property_cached
+    def count_cache(self):
+        """Maps table names to their row count and the version it was taken at."""
+        return {}
 
-    def index(self, column='id', table=None):
+    @property
+    def in_transaction(self):
+        """Is a transaction pending on any of our opened connections."""
+        cache = self.__dict__.get('__cache__', {})
+        return any(cache[name].in_transaction for name in
+                   ('connection', 'own_connection') if name in cache)
+
+    @property
+    def data_version(self):
+        """
+        A value that changes whenever the database is modified. The
+        `data_version` pragma catches commits by other connections and
+        the `total_changes` counter catches our own modifications.
+        """
+        version = self.own_cursor.execute('PRAGMA data_version;').fetchone()[0]
+        return version, self.own_connection.total_changes
+
+    # The name of the table holding the maintained counts #
+    counts_table = 'row_counts'
+
+    def maintain_count(self, table=None):
+        """
+        Keep the number of rows of a table in a separate small table that
+        is updated by triggers at every insertion and deletion. Calling
+        `len()` then costs a single lookup even across processes, at the
+        price of slightly slower insertions.
+        """
+        if table is None: table = self.main_table
+        # The counter table #
+        query = 'CREATE TABLE if not exists "%s" (name text PRIMARY KEY, count integer);'
+        self.own_cursor.execute(query % self.counts_table)
+        # The triggers #
+        query = 'CREATE TRIGGER if not exists "%s_count_%s" AFTER %s ON "%s" BEGIN ' \
+                'UPDATE "%s" SET count = count %s 1 WHERE name = \'%s\'; END;'
+        for event, sign in (('insert', '+'), ('delete', '-')):
+            params = (table, event, event.upper(), table, self.counts_table, sign, table)
+            self.own_cursor.execute(query % params)
+        # The initial value #
+        query = 'INSERT OR REPLACE INTO "%s" (name, count) SELECT ?, COUNT(1) FROM "%s";'
+        self.own_cursor.execute(query % (self.counts_table, table), (table,))
+        self.own_connection.commit()
+
+    def get_maintained_count(self, table=None):
+        """The count kept by `maintain_count()`, or `None` if there is none."""
+        if table is None: table = self.main_table
+        if self.counts_table not in self.tables: return None
+        query = 'SELECT count FROM "%s" WHERE name=?;' % self.counts_table
+        row   = self.own_cursor.execute(query, (table,)).fetchone()
+        return None if row is None else int(row[0])
+
+    def index(self, column='id', table=None, name=None, include=None,
+              where=None, unique=False):
+        """
+        Create an index on one or several columns of a table.
+
+        * The column option is a column name, or a list of column names
+          for a composite index.
+
+        * The name option defaults to `<table>_<columns>_index`. Nothing is
+          done if an equivalent index with the same columns already exists.
+
+        * The include option adds columns after the key columns. SQLite
+          has no real `INCLUDE` clause, but a query that only touches
+          indexed columns is answered from the index alone (covering).
+
+        * The where option makes a partial index, e.g. `"length > 100"`.
+
+        * The unique option creates a `UNIQUE` index.
+
+        Returns the name of the index.
+        """
+        # Default values #
         if table is None: table = self.main_table
-        index_name = table + '_index'
+        columns = [column] if isinstance(column, str) else list(column)
+        if include is not None: columns += [c for c in include if c not in columns]
+        # Skip if it exists already under any name #
+        if where is None:
+            for existing in self.get_indexes(table):
+                if existing['columns'] != columns:    continue
+                if existing['partial']:               continue
+                if unique and not existing['unique']: continue
+                return existing['name']
+        # Name #
+        suffix = 'unique' if unique else 'index'
+        if name is None: name = '%s_%s_%s' % (table, '_'.join(columns), suffix)
+        # Build the command #
+        unique  = "UNIQUE " if unique else ""
+        cols    = ','.join('"' + c + '"' for c in columns)
+        command = 'CREATE %sINDEX if not exists "%s" on "%s" (%s)'
+        command = command % (unique, name, table, cols)
+        if where is not None: command += ' WHERE %s' % where
+        # Do it #
         try:
-            command = 'CREATE INDEX if not exists "%s" on "%s" (%s);'
-            command = command % (index_name, table, column)
-            self.own_cursor.execute(command)
+            self.own_cursor.execute(command + ';')
         except KeyboardInterrupt as err:
             print("You interrupted the creation of the index. Not committing.")
             raise err
+        # Return #
+        return name
+
+    def get_indexes(self, table=None):
+        """
+        Return the list of indexes on a table. Every index is a dictionary
+        with its `name`, `columns`, and whether it's `unique` or `partial`.
+        Indexes created automatically by SQLite are included.
+        """
+        if table is None: table = self.main_table
+        cursor = self.own_connection.cursor()
+        cursor.row_factory = None
+        # The table-valued functions avoid issuing real PRAGMAs #
+        query   = 'SELECT name, "unique", partial FROM pragma_index_list(?);'
+        indexes = cursor.execute(query, (table,)).fetchall()
+        result  = []
+        for name, unique, partial in indexes:
+            query   = 'SELECT name FROM pragma_index_info(?) ORDER BY seqno;'
+            columns = [x[0] for x in cursor.execute(query, (name,)).fetchall()]
+            result.append({'name':    name,
+                           'columns': columns,
+                           'unique':  bool(unique),
+                           'partial': bool(partial)})
+        return result
+
+    def drop_index(self, name):
+        """Remove an index by its name."""
+        self.own_cursor.execute('DROP INDEX if exists "%s";' % name)
+
+    def build_indexes(self, specs, table=None, analyze=True):
+        """
+        Create several indexes at once, typically after a bulk load, since
+        it is much faster to index a full table than to update the indexes
+        at every insertion. Everything is committed at the end.
+
+        * The specs option is a list where each element is either a column
+          name, a list of column names, or a dictionary of keyword arguments
+          for the `index()` method.
+
+        * The analyze option runs `analyze()` once the indexes are built.
+
+            >>> db.build_indexes(['id', ['sample', 'length'],
+            >>>                   {'column': 'orf_id', 'where': 'length > 100'}])
+        """
+        # Build them one by one #
+        names = []
+        for spec in specs:
+            if not isinstance(spec, dict): spec = {'column': spec}
+            names.append(self.index(table=table, **spec))
+        self.own_connection.commit()
+        # Update the statistics #
+        if analyze: self.analyze(table)
+        # Return #
+        return names
+
+    def analyze(self, table=None):
+        """
+        Gather the statistics that the query planner relies on to pick the
+        right index. Without them, the planner can choose a full scan even
+        when a good index exists. Followed by `PRAGMA optimize`.
+        """
+        if self.own_connection.in_transaction: self.own_connection.commit()
+        if table is None: self.own_cursor.execute('ANALYZE;')
+        else:             self.own_cursor.execute('ANALYZE "%s";' % table)
+        self.own_cursor.execute('PRAGMA optimize;')
+        if self.own_connection.in_transaction: self.own_connection.commit()
 
     def get_first(self, table=None):
         """Just the first entry."""
         if table is None: table = self.main_table
         query = 'SELECT * FROM "%s" LIMIT 1;' % table
-        return self.own_cursor.execute(query).fetchone()
+        return self.table_cursor(table).execute(query).fetchone()
 
     def get_last(self, table=None):
         """Just the last entry."""
         if table is None: table = self.main_table
         query = 'SELECT * FROM "%s" ORDER BY ROWID DESC LIMIT 1;' % table
-        return self.own_cursor.execute(query).fetchone()
+        return self.table_cursor(table).execute(query).fetchone()
 
     def get_number(self, num, table=None):
-        """Get a specific entry by its number."""
+        """
+        Get a specific entry by its number. When the rowids of the table
+        have no gaps, the entry is found directly by its rowid instead of
+        stepping over all the previous rows with `OFFSET`.
+        """
         if table is None: table = self.main_table
+        # Fast path #
+        low, high = self.get_rowid_bounds(table)
+        if low is not None and high - low + 1 == self.count_entries(table):
+            return self.get_by_rowid(low + num, table) if num < high - low + 1 else None
+        # Slow path #
         query = 'SELECT * from "%s" LIMIT 1 OFFSET %i;' % (table, num)
-        self.own_cursor.execute(query)
-        return self.own_cursor.fetchone()
+        return self.table_cursor(table).execute(query).fetchone()
+
+    def get_rowid_bounds(self, table=None):
+        """The smallest and largest rowids of a table, `(None, None)` if empty."""
+        if table is None: table = self.main_table
+        query = 'SELECT MIN(rowid), MAX(rowid) FROM "%s";' % table
+        cursor = self.own_connection.cursor()
+        cursor.row_factory = None
+        return cursor.execute(query).fetchone()
+
+    def get_rowid_ranges(self, size, table=None):
+        """
+        Split the rows of a table in consecutive ranges of `size` rows,
+        returned as a list of `(first, last)` rowids, both included. The
+        boundaries are taken from the rowids that exist, reading them once
+        in order, so that gaps in the rowids never make empty ranges.
+        """
+        if table is None: table = self.main_table
+        cursor = self.own_connection.cursor()
+        cursor.row_factory = None
+        cursor.execute('SELECT rowid FROM "%s" ORDER BY rowid;' % table)
+        starts = [rowid for (rowid,) in itertools.islice(cursor, 0, None, size)]
+        if not starts: return []
+        high = self.get_rowid_bounds(table)[1]
+        ends = [start - 1 for start in starts[1:]] + [high]
+        return list(zip(starts, ends))
+
+    def get_by_rowid(self, rowid, table=None):
+        """Get a specific entry by its rowid, this is a single B-tree lookup."""
+        if table is None: table = self.main_table
+        query = 'SELECT * from "%s" WHERE rowid=?;' % table
+        return self.table_cursor(table).execute(query, (rowid,)).fetchone()
+
+    def get_by_rowids(self, rowids, table=None):
+        """Get several entries by their rowids in one query, in rowid order."""
+        if table is None: table = self.main_table
+        # Integers are safe to inline and avoid the limit on bound variables #
+        rowids = ','.join(str(int(r)) for r in rowids)
+        query  = 'SELECT * from "%s" WHERE rowid IN (%s);' % (table, rowids)
+        return self.table_cursor(table).execute(query).fetchall()
+
+    def sample(self, k, seed=None, table=None):
+        """
+        Return `k` distinct entries drawn uniformly at random. Random rowids
+        are drawn between the smallest and largest rowids, and those that
+        fall in gaps are rejected and replaced. Each round of draws is
+        fetched with a single query, usually only one round is needed.
+        The cost is O(k log n) instead of O(n) with `ORDER BY random()`.
+
+        When the rowids are sparse (e.g. an `INTEGER PRIMARY KEY` with large
+        gaps) most draws would be rejected, so positions are drawn instead
+        and the rowids are read once in order to find them, which is O(n).
+        """
+        if table is None: table = self.main_table
+        rng = random.Random(seed)
+        # Check #
+        count = self.count_entries(table)
+        if k > count: raise ValueError("Sample larger than the table (%i rows)." % count)
+        if k == 0: return []
+        # The span of rowids #
+        low, high = self.get_rowid_bounds(table)
+        span      = high - low + 1
+        density   = count / span
+        # Too sparse for drawing rowids #
+        if density < 0.01: return self.sample_by_scan(k, count, rng, table)
+        # Rounds of draws #
+        drawn, result = set(), []
+        while len(result) < k:
+            need = k - len(result)
+            # Draw a bit more than needed to account for the gaps #
+            size = min(math.ceil(need / density * 1.1) + 8, span - len(drawn))
+            size = min(size, max(10 * need, 100000))
+            new  = set()
+            while len(new) < size:
+                rowid = rng.randint(low, high)
+                if rowid not in drawn: new.add(rowid)
+            drawn |= new
+            # Keep just what we need #
+            rows = self.get_by_rowids(new, table)
+            result += rng.sample(rows, min(need, len(rows)))
+        # Return in random order #
+        rng.shuffle(result)
+        return result
+
+    def sample_by_scan(self, k, count, rng, table):
+        """
+        Draw `k` distinct positions among `count` rows, then read the rowids
+        in order once, keeping those found at the positions drawn.
+        """
+        positions = sorted(rng.sample(range(count), k))
+        cursor    = self.open_cursor()
+        cursor.row_factory = None
+        cursor.execute('SELECT rowid FROM "%s";' % table)
+        rowids, wanted = [], iter(positions)
+        target = next(wanted)
+        for i, (rowid,) in enumerate(cursor):
+            if i != target: continue
+            rowids.append(rowid)
+            target = next(wanted, None)
+            if target is None: break
+        self.release_cursor(cursor)
+        cursor.close()
+        # Fetch them #
+        result = self.get_by_rowids(rowids, table)
+        rng.shuffle(result)
+        return result
+
+    def iter_sample(self, k, seed=None, table=None):
+        """
+        Same as `sample()` but yields the entries one by one, each fetched
+        with its own rowid lookup. Useful when `k` is large.
+        """
+        if table is None: table = self.main_table
+        rng = random.Random(seed)
+        # Check #
+        count = self.count_entries(table)
+        if k > count: raise ValueError("Sample larger than the table (%i rows)." % count)
+        if k == 0: return
+        # Too sparse for drawing rowids #
+        low, high = self.get_rowid_bounds(table)
+        if count / (high - low + 1) < 0.01:
+            yield from self.sample_by_scan(k, count, rng, table)
+            return
+        # Draw with rejection #
+        drawn, found = set(), 0
+        while found < k:
+            rowid = rng.randint(low, high)
+            if rowid in drawn: continue
+            drawn.add(rowid)
+            entry = self.get_by_rowid(rowid, table)
+            if entry is None: continue
+            found += 1
+            yield entry
 
     def get(self, table, column, key):
         return self.get_entry(key, column, table)
@@ -334,63 +916,1143 @@ class SQLiteDatabase(FilePath):
         """Get a specific entry."""
         if table is None:  table  = self.main_table
         if column is None: column = "id"
-        if isinstance(key, str): key = key.replace("'","''")
-        query = 'SELECT * from "%s" where "%s"=="%s" LIMIT 1;'
-        query = query % (table, column, key)
-        self.own_cursor.execute(query)
-        return self.own_cursor.fetchone()
+        query  = 'SELECT * from "%s" where "%s"==? LIMIT 1;' % (table, column)
+        start  = time.perf_counter()
+        result = self.table_cursor(table).execute(query, (key,)).fetchone()
+        self.log_query(query, (key,), time.perf_counter() - start,
+                       0 if result is None else 1)
+        return result
 
     def vacuum(self):
         """Compact the database, remove old transactions."""
         self.own_cursor.execute("VACUUM")
 
+    def snapshot(self, dest, pages_per_step=1024, sleep=0.01, progress=False,
+                 vacuum=False, overwrite=False):
+        """
+        Write a consistent copy of this database to `dest` while it is
+        still in use, which is not safe to do with a plain file copy.
+        Returns a new `SQLiteDatabase` object pointing to the copy.
+
+        * With the default online backup API, `pages_per_step` pages are
+          copied at a time, pausing `sleep` seconds in between so that
+          other connections can write in the meantime. If another
+          connection does write, the copy restarts to stay consistent.
+
+        * The progress option prints the advancement and the final
+          throughput. It can also be a function that will be called with
+          `(status, remaining, total)` after every step.
+
+        * The vacuum option uses `VACUUM INTO` instead, which produces a
+          compacted copy in one go but holds a read transaction meanwhile.
+        """
+        # Check the destination #
+        dest = str(getattr(dest, 'path', dest))
+        if os.path.exists(dest):
+            if overwrite: os.remove(dest)
+            else: raise Exception("File exists already at '%s'" % dest)
+        # Finish any transaction of ours, otherwise it would not be included #
+        if self.own_connection.in_transaction: self.own_connection.commit()
+        start = time.perf_counter()
+        # Compacted copy #
+        if vacuum:
+            self.own_cursor.execute('VACUUM INTO ?;', (dest,))
+        # Incremental copy #
+        else:
+            if progress is True:
+                def progress(status, remaining, total):
+                    done = total - remaining
+                    print("Copied %i/%i pages (%.1f%%)" % (done, total, 100*done/total))
+            target = sqlite3.connect(dest)
+            try:
+                self.own_connection.backup(target,
+                                           pages    = pages_per_step,
+                                           progress = progress or None,
+                                           sleep    = sleep)
+            finally:
+                target.close()
+        # Report the throughput #
+        if progress:
+            elapsed = time.perf_counter() - start
+            size    = os.path.getsize(dest) / 1024 / 1024
+            print("Snapshot of %.1f MiB done in %.2f seconds (%.1f MiB/s)."
+                  % (size, elapsed, size / max(elapsed, 1e-9)))
+        # Return #
+        return self.__class__(dest)
+
+    def open(self):
+        """
+        Reopen a database that was closed. Calling this is optional since
+        the connections are opened again on first use anyway. The checks
+        of `prepare()`, such as the MD5 sum, are not repeated.
+        """
+        self.own_connection
+        return self
+
     def close(self):
-        self.cursor.close()
-        self.connection.close()
-        self.own_cursor.close()
-        self.own_connection.close()
+        """
+        Close the connections and cursors that were opened, and forget
+        them so that new ones are made on next use. What we remember about
+        the content of the database (counts, codecs, cached results) is
+        forgotten too, since it might change while we are not connected.
+        """
+        if self.lock is not None:
+            with self.lock: return self.close_handles()
+        return self.close_handles()
+
+    def close_handles(self):
+        """Same as `close()` but without taking the lock."""
+        # Stop watching #
+        if self.idle_timer is not None: self.idle_timer.cancel()
+        self.idle_timer = None
+        # Cursors first #
+        cache = self.__dict__.get('__cache__', {})
+        for name in ('cursor', 'own_cursor', 'connection', 'own_connection'):
+            handle = cache.pop(name, None)
+            if handle is not None: handle.close()
+        # Forget the rest #
+        self.open_cursors.clear()
+        cache.pop('count_cache', None)
+        self.codecs = None
+        if self.result_cache is not None: self.result_cache.clear()
+
+    @property
+    def is_open(self):
+        """Is there any connection currently opened."""
+        cache = self.__dict__.get('__cache__', {})
+        return 'connection' in cache or 'own_connection' in cache
+
+    def table_cursor(self, table):
+        """
+        A new cursor on our own connection for reading the rows of a table.
+        The compressed columns of that table, and only those, are
+        decompressed before the rows reach the user's factory.
+        """
+        cursor = self.own_connection.cursor()
+        codecs = self.get_codecs(table)
+        if codecs: cursor.row_factory = self.make_row_factory(codecs)
+        return cursor
+
+    def open_cursor(self, table=None):
+        """
+        A new cursor on our own connection, for results that are read over
+        a long time. Until it is garbage collected or given back with
+        `release_cursor()`, the idle timer will not close the connections.
+        When a table is given, see `table_cursor()`.
+        """
+        if table is None: cursor = self.own_connection.cursor()
+        else:             cursor = self.table_cursor(table)
+        if self.lock is None: return cursor
+        with self.lock: self.open_cursors.add(cursor)
+        return cursor
+
+    def release_cursor(self, cursor):
+        """The cursor is not used anymore, the connections can be closed."""
+        if self.lock is None: return
+        with self.lock: self.open_cursors.discard(cursor)
+
+    def start_idle_timer(self, delay=None):
+        """Check for inactivity in a background thread after a delay."""
+        if delay is None: delay = self.idle
+        self.idle_timer = threading.Timer(delay, self.check_idle)
+        self.idle_timer.daemon = True
+        self.idle_timer.start()
+
+    def check_idle(self):
+        """
+        Called from the timer thread. Closes the connections if they have
+        not been used for `idle` seconds, no transaction is pending and no
+        cursor from `open_cursor()` is in use, otherwise checks again later.
+        """
+        with self.lock:
+            if self.idle_timer is None: return
+            busy      = self.in_transaction or len(self.open_cursors) > 0
+            remaining = self.last_used + self.idle - time.monotonic()
+            if busy:          return self.start_idle_timer()
+            if remaining > 0: return self.start_idle_timer(remaining)
+            self.close_handles()
 
     # ------------------------------- Pandas -------------------------------- #
-    def write_df(self, df, table=None, *args, **kwargs):
+    def write_df(self, df, table=None, mode='replace', key=None, types=None,
+                 chunksize=None, **kwargs):
         """
         Create a table and populate it with content from a dataframe.
-        If the table already exists it is dropped before being overwritten.
+        The index of the dataframe is not written.
+
+        * The mode option can be:
+            - 'replace': if the table already exists it is dropped before
+              being overwritten.
+            - 'append': the rows are added to the table, which is created
+              if it doesn't exist yet.
+            - 'upsert': rows whose key is already present in the table are
+              updated, the others are inserted. Only the changed rows are
+              written, instead of the whole table.
+
+        * The key option is a column name or a list of column names
+          identifying a row. Required for 'upsert', a unique index is
+          created on those columns if needed.
+
+        * The types option maps column names to SQL types, it overrides
+          the types derived from the dtypes of the dataframe.
+
+        * The chunksize option is how many rows go in every `INSERT`
+          statement. By default, as many as the SQLite limit on the number
+          of bound variables allows.
+
+        * Any other keyword argument, such as `dtype`, is passed to
+          `pandas.DataFrame.to_sql` which then writes the table instead,
+          as was done before. Only the 'replace' mode is available then.
+
+        Everything happens in a single transaction.
         """
         # Default value for table #
         if table is None: table = self.main_table
-        # Call pandas function #
-        return df.to_sql(table,
-                         con       = self.own_connection,
-                         if_exists = 'replace',
-                         index     = False,
-                         *args, **kwargs)
+        # Check #
+        if mode not in ('replace', 'append', 'upsert'):
+            raise Exception("Unknown mode '%s'." % mode)
+        # Older calls with options for pandas #
+        if kwargs:
+            if mode != 'replace':
+                raise Exception("Options for pandas require the 'replace' mode.")
+            return df.to_sql(table,
+                             con       = self.own_connection,
+                             if_exists = 'replace',
+                             index     = False,
+                             **kwargs)
+        if mode == 'upsert' and key is None:
+            raise Exception("The 'upsert' mode requires a key.")
+        if isinstance(key, str): key = [key]
+        # The SQL types #
+        columns = [str(c) for c in df.columns]
+        decl    = {c: sql_type_of(df[c].dtype) for c in df.columns}
+        decl    = {str(c): t for c,t in decl.items()}
+        if types is not None: decl.update(types)
+        # Rows per statement #
+        limit = 32766 if sqlite3.sqlite_version_info >= (3,32,0) else 999
+        rows  = max(1, limit // max(1, len(columns)))
+        if chunksize is not None: rows = min(rows, chunksize)
+        # The insert statement #
+        cols   = ','.join('"' + c + '"' for c in columns)
+        marks  = '(' + ','.join('?' for c in columns) + ')'
+        insert = 'INSERT INTO "%s" (%s) VALUES ' % (table, cols)
+        if mode == 'upsert':
+            others   = [c for c in columns if c not in key]
+            updates  = ','.join('"%s"=excluded."%s"' % (c, c) for c in others)
+            conflict = ' ON CONFLICT (%s) DO ' % ','.join('"' + c + '"' for c in key)
+            conflict += ('UPDATE SET ' + updates) if others else 'NOTHING'
+        else:
+            conflict = ''
+        # Start the transaction #
+        if self.own_connection.in_transaction: self.own_connection.commit()
+        cursor = self.own_connection.cursor()
+        cursor.execute('BEGIN;')
+        try:
+            # Create the table #
+            if mode == 'replace': cursor.execute('DROP TABLE if exists "%s";' % table)
+            fields = ','.join('"%s" %s' % (c, decl[c]) for c in columns)
+            cursor.execute('CREATE TABLE if not exists "%s" (%s);' % (table, fields))
+            # The key must be unique #
+            if key is not None: self.index(key, table=table, unique=True)
+            # Insert by chunks #
+            for start in range(0, len(df), rows):
+                chunk  = df_to_python(df.iloc[start:start+rows])
+                values = [v for row in chunk for v in row]
+                sql    = insert + ','.join(marks for row in chunk) + conflict + ';'
+                cursor.execute(sql, values)
+            # Commit #
+            self.own_connection.commit()
+        except BaseException as err:
+            self.own_connection.rollback()
+            raise err
 
-    def read_df(self, table=None):
+    def read_df(self, table=None, columns=None, where=None, typed=True,
+                categories=None, chunksize=None):
         """
         Read a table and return dataframe.
         Using `pandas.read_sql_table()` requires SQLAlchemy.
+
+        * The columns option restricts the columns that are read.
+
+        * The where option is an SQL condition such as `"length > 100"`.
+
+        * The typed option casts every column to the dtype that corresponds
+          to its declared SQL type. Integer columns are always `Int64`, so
+          that every chunk has the same dtype whether it contains NULLs
+          or not, and they don't become `float64`.
+
+        * The categories option is a ratio between 0 and 1. Text columns
+          with fewer distinct values than this proportion of the rows will
+          be converted to the `category` dtype.
+
+        * The chunksize option will make this method return a generator
+          of dataframes, each having at most `chunksize` rows.
+
+        The rows are always fetched in chunks that are converted one by
+        one, so that the peak memory stays close to the final dataframe.
         """
         # Default value for table #
         if table is None: table = self.main_table
         # Make the query to avoid SQLAlchemy dependency #
-        query = 'SELECT * FROM "%s";' % table
-        # Call pandas function #
-        return pandas.read_sql_query(query, con = self.own_connection)
+        query = self.select_query(table, columns, where)
+        # The dtypes from the declared types #
+        affinities = {}
+        if typed:
+            types = self.get_column_types(table)
+            affinities = {k: sql_affinity(v) for k,v in types.items()}
+        # The generator #
+        size   = chunksize if chunksize is not None else self.read_chunk_size
+        codecs = self.get_codecs(table)
+        chunks = self.iter_df(query, affinities, categories, size, codecs)
+        # Return a generator #
+        if chunksize is not None: return chunks
+        # Check the cache #
+        cache = self.result_cache
+        if cache is not None:
+            key     = cache.make_key(query, (), 'read_df', typed, categories)
+            version = self.cache_version
+            hit     = cache.get(key, version)
+            if hit is not None: return hit.copy()
+        # Or assemble everything #
+        df = concat_chunks(chunks)
+        # Store in the cache, unless a rollback could still undo what we see #
+        if cache is not None and not self.in_transaction:
+            cache.put(key, version, df, int(df.memory_usage(deep=True).sum()))
+            df = df.copy()
+        # Return #
+        return df
 
-    # ----------------------------- Unfinished ------------------------------ #
-    def add_column(self, name, kind=None, table=None):
-        """Add add a new column to a table."""
-        pass
+    def read_columns(self, columns=None, where=None, table=None, dtypes=None,
+                     chunksize=None):
+        """
+        Read columns of a table as a dictionary of numpy arrays, without
+        going through a dataframe. Arrays are allocated with a type chosen
+        from the declared type of each column ('integer' gives `int64`,
+        'real' gives `float64` and the rest gives `object`), then filled
+        chunk by chunk as rows are fetched, doubling their capacity when
+        full. Hence numeric values only ever exist as Python objects for
+        one chunk at a time.
 
-    def open(self):
-        """Reopen a database that was closed, useful for debugging."""
-        pass
+        * The where option is an SQL condition such as `"length > 100"`.
 
-    def uniquify(self, name, kind=None, table=None):
-        """Remove entries that have duplicate values on a specific column."""
-        query = 'DELETE from "data" WHERE rowid not in (select min(rowid) from data group by id);'
-        pass
+        * The dtypes option maps column names to numpy dtypes and overrides
+          the automatic choice.
 
+        An integer column containing NULLs is converted to `float64` with
+        NaN in place of the missing values. A numeric column containing
+        text, such as the empty strings of older databases, is returned as
+        `object` with its values unchanged.
+        """
+        import numpy
+        # Default values #
+        if table is None:     table     = self.main_table
+        if chunksize is None: chunksize = self.read_chunk_size
+        if columns is None:   columns   = self.get_columns_of_table(table)
+        # Pick the dtypes #
+        kinds  = {'integer': numpy.int64, 'real': numpy.float64}
+        types  = self.get_column_types(table)
+        chosen = {c: kinds.get(sql_affinity(types.get(c, '')), object) for c in columns}
+        if dtypes is not None: chosen.update(dtypes)
+        # Allocate #
+        capacity = chunksize
+        arrays   = {c: numpy.empty(capacity, dtype=chosen[c]) for c in columns}
+        codecs   = self.get_codecs(table)
+        # Execute #
+        cursor = self.open_cursor()
+        cursor.row_factory = None
+        cursor.execute(self.select_query(table, columns, where))
+        count = 0
+        # Main loop #
+        while True:
+            rows = cursor.fetchmany(chunksize)
+            if not rows: break
+            end = count + len(rows)
+            # Grow geometrically #
+            if end > capacity:
+                while end > capacity: capacity *= 2
+                for array in arrays.values(): array.resize(capacity, refcheck=False)
+            # Fill every column #
+            for col, values in zip(columns, zip(*rows)):
+                if col in codecs: values = [codecs[col].decompress(v) for v in values]
+                try:
+                    arrays[col][count:end] = values
+                except (TypeError, ValueError):
+                    # NULLs in an integer column #
+                    if all(v is None or isinstance(v, numbers.Real) for v in values):
+                        arrays[col] = arrays[col].astype(numpy.float64)
+                        arrays[col][count:end] = numpy.array(values, dtype=numpy.float64)
+                    # Text in a numeric column, such as empty strings #
+                    else:
+                        arrays[col] = arrays[col].astype(object)
+                        arrays[col][count:end] = values
+            count = end
+        self.release_cursor(cursor)
+        # Shrink to the final size #
+        for array in arrays.values(): array.resize(count, refcheck=False)
+        # Return #
+        return arrays
+
+    def select_query(self, table, columns=None, where=None):
+        """Build a simple `SELECT` statement on a table."""
+        if columns is None: cols = '*'
+        else:               cols = ','.join('"' + c + '"' for c in columns)
+        query = 'SELECT %s FROM "%s"' % (cols, table)
+        if where is not None: query += ' WHERE %s' % where
+        return query + ';'
+
+    def iter_df(self, query, affinities, categories, chunksize, codecs=None):
+        """
+        Execute a query and yield the results as successive dataframes.
+        The same columns will be made categorical in every chunk, based on
+        the content of the first chunk.
+        """
+        # A new cursor that always returns tuples #
+        cursor = self.open_cursor()
+        cursor.row_factory = None
+        start = time.perf_counter()
+        cursor.execute(query)
+        names = [x[0] for x in cursor.description]
+        # Only the time spent in SQLite is reported to the profiler #
+        elapsed = time.perf_counter() - start
+        count   = 0
+        # Which columns will be categories, decided on the first chunk #
+        to_categorize = None
+        # Main loop #
+        while True:
+            start    = time.perf_counter()
+            rows     = cursor.fetchmany(chunksize)
+            elapsed += time.perf_counter() - start
+            count   += len(rows)
+            if not rows and to_categorize is not None: break
+            df = pandas.DataFrame.from_records(rows, columns=names)
+            del rows
+            # Decompress the compressed columns #
+            for col, codec in (codecs or {}).items():
+                if col in df: df[col] = df[col].map(codec.decompress)
+            # Cast the numeric columns #
+            for col in names:
+                kind = affinities.get(col)
+                if kind == 'integer' and df[col].dtype != 'Int64':
+                    df[col] = safe_cast(df[col], 'Int64')
+                if kind == 'real' and df[col].dtype.kind != 'f':
+                    df[col] = safe_cast(df[col], 'float64')
+            # Pick the categorical columns #
+            if to_categorize is None:
+                to_categorize = []
+                if categories is not None and len(df):
+                    to_categorize = [col for col in names
+                                     if affinities.get(col) == 'text'
+                                     and df[col].nunique() <= categories * len(df)]
+            # Convert them #
+            for col in to_categorize: df[col] = df[col].astype('category')
+            # Return #
+            yield df
+            # The last chunk #
+            if len(df) < chunksize: break
+        self.release_cursor(cursor)
+        # Report #
+        self.log_query(query, (), elapsed, count)
+
+    # -------------------------------- Arrow -------------------------------- #
+    def arrow_schema(self, table=None, columns=None, types=None):
+        """
+        The Arrow schema of a table, derived from the declared type of each
+        column. 'integer' gives `int64`, 'real' gives `float64`, 'blob' gives
+        `binary` and the rest gives `string`. This includes the 'numeric'
+        affinity, which covers dates, timestamps, booleans and decimals,
+        whose values are written as text. Compressed columns are strings
+        since they are decompressed on export.
+
+        * The types option maps column names to Arrow types and overrides
+          the automatic choice.
+        """
+        import pyarrow
+        # Default values #
+        if table is None:   table   = self.main_table
+        if columns is None: columns = self.get_columns_of_table(table)
+        # The mapping #
+        kinds = {'integer': pyarrow.int64(),
+                 'real':    pyarrow.float64(),
+                 'blob':    pyarrow.binary()}
+        declared = self.get_column_types(table)
+        codecs   = self.get_codecs(table)
+        # Build the fields #
+        fields = []
+        for col in columns:
+            kind = declared.get(col, '')
+            if types and col in types: kind = types[col]
+            elif col in codecs:        kind = pyarrow.string()
+            elif not kind:             kind = pyarrow.string()
+            else:                      kind = kinds.get(sql_affinity(kind), pyarrow.string())
+            fields.append(pyarrow.field(col, kind))
+        # Return #
+        return pyarrow.schema(fields)
+
+    def iter_record_batches(self, table=None, columns=None, where=None,
+                            batch_size=None, types=None):
+        """
+        Execute a `SELECT` on a table and yield the results as successive
+        Arrow record batches of `batch_size` rows. Only one batch is ever
+        held in memory, so this works on tables much bigger than the RAM.
+
+        SQLite does not enforce the declared types, so a value that does
+        not fit its field is written as text in a string field and becomes
+        a null in a numeric field, e.g. the empty strings of older databases
+        in an integer column.
+        """
+        import pyarrow
+        # Default values #
+        if table is None:      table      = self.main_table
+        if batch_size is None: batch_size = self.read_chunk_size
+        if columns is None:    columns    = self.get_columns_of_table(table)
+        schema = self.arrow_schema(table, columns, types)
+        codecs = self.get_codecs(table)
+        # A new cursor that always returns tuples #
+        query  = self.select_query(table, columns, where)
+        cursor = self.open_cursor()
+        cursor.row_factory = None
+        start = time.perf_counter()
+        cursor.execute(query)
+        elapsed = time.perf_counter() - start
+        count   = 0
+        # Main loop #
+        while True:
+            start    = time.perf_counter()
+            rows     = cursor.fetchmany(batch_size)
+            elapsed += time.perf_counter() - start
+            if not rows: break
+            count   += len(rows)
+            # Convert column by column #
+            arrays = []
+            for field, values in zip(schema, zip(*rows)):
+                if field.name in codecs:
+                    values = [codecs[field.name].decompress(v) for v in values]
+                try:
+                    arrays.append(pyarrow.array(values, type=field.type))
+                except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+                    # Values that don't match the declared type #
+                    values = arrow_fit(values, field.type)
+                    arrays.append(pyarrow.array(values, type=field.type))
+            del rows
+            yield pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+        self.release_cursor(cursor)
+        # Report #
+        self.log_query(query, (), elapsed, count)
+
+    def record_batch_reader(self, table=None, columns=None, where=None,
+                            batch_size=None, types=None):
+        """
+        Same as `iter_record_batches()` but wrapped in an Arrow
+        `RecordBatchReader`, which can be handed directly to anything that
+        consumes Arrow streams, such as `pyarrow.dataset.write_dataset`,
+        DuckDB or Polars.
+
+            >>> reader = db.record_batch_reader(columns=['id', 'length'])
+            >>> import duckdb
+            >>> duckdb.sql('SELECT avg(length) FROM reader')
+        """
+        import pyarrow
+        if table is None: table = self.main_table
+        schema  = self.arrow_schema(table, columns, types)
+        batches = self.iter_record_batches(table, columns, where, batch_size, types)
+        return pyarrow.RecordBatchReader.from_batches(schema, batches)
+
+    def export_parquet(self, path, table=None, columns=None, where=None,
+                       row_group_size=100000, types=None, **kwargs):
+        """
+        Write a table to a Parquet file, streaming it one row group at a
+        time so that memory use stays bounded whatever the size of the table.
+
+        * The row_group_size option is the number of rows per row group,
+          which is also the number of rows read from SQLite at once.
+
+        * Any other keyword argument is passed to `pyarrow.parquet.ParquetWriter`,
+          for instance `compression='zstd'`.
+
+        Returns the path of the file written.
+        """
+        import pyarrow.parquet
+        reader = self.record_batch_reader(table, columns, where, row_group_size, types)
+        with pyarrow.parquet.ParquetWriter(str(path), reader.schema, **kwargs) as writer:
+            for batch in reader: writer.write_batch(batch, row_group_size=row_group_size)
+        return path
+
+    # ------------------------------ Parallel ------------------------------- #
+    def parallel_map(self, func, table=None, n_workers=None, chunk_rows=10000,
+                     columns=None, dest=None, dest_columns=None, batched=False,
+                     ordered=True, progress=False):
+        """
+        Apply `func` to every row of a table using a pool of processes.
+        The rows are split in ranges of `chunk_rows`, and every worker
+        process reads the ranges it is handed through its own read-only
+        connection, so that CPU-bound work scales across all cores.
+
+        * The func option must be importable (i.e. defined at the module
+          level) so that it can be sent to the workers. It receives one row
+          at a time and returns one result, unless `batched` is true, in
+          which case it receives the list of rows of a range and returns a
+          list of results.
+
+        * The columns option restricts the columns read.
+
+        * The dest option is the name of an existing table in this database.
+          When given, the results are not returned but inserted in that table
+          by this process only, one transaction per range. Each result must
+          then be a tuple of values for `dest_columns`.
+
+        * The ordered option can be set to `False` to receive the ranges in
+          the order they finish rather than in rowid order.
+
+        Returns the list of results, or the number of rows inserted.
+
+            >>> from mymodule import gc_content
+            >>> gcs = db.parallel_map(gc_content, columns=['id', 'seq'])
+        """
+        # Default values #
+        if table is None:     table     = self.main_table
+        if n_workers is None: n_workers = os.cpu_count()
+        # Split in ranges of rowids #
+        ranges = self.get_rowid_ranges(chunk_rows, table)
+        if not ranges: return 0 if dest is not None else []
+        query  = self.select_query(table, columns, 'rowid BETWEEN ? AND ?')
+        tasks  = [(query, table, start, end, func, batched) for start, end in ranges]
+        # Display progress bar #
+        if progress:
+            import tqdm
+            progress = lambda x: tqdm.tqdm(x, total=len(tasks))
+        else:
+            progress = lambda x:x
+        # Every worker opens the same file #
+        options = {'factory': self.factory, 'text_fact': self.text_fact,
+                   'readonly': self.readonly}
+        pool    = multiprocessing.Pool(n_workers, init_map_worker, (self.path, options))
+        # Collect the results #
+        with pool:
+            mapper  = pool.imap if ordered else pool.imap_unordered
+            results = progress(mapper(map_rowid_range, tasks))
+            if dest is None: return [result for chunk in results for result in chunk]
+            # Or insert them with a single writer #
+            count = 0
+            for chunk in results:
+                if not chunk: continue
+                self.own_cursor.execute('BEGIN;')
+                self.add(chunk, table=dest, columns=dest_columns)
+                self.own_connection.commit()
+                count += len(chunk)
+            return count
+
+    # ------------------------------- Schema -------------------------------- #
+    def add_column(self, name, kind=None, table=None, values=None, on=None,
+                   batch_size=50000, progress=False):
+        """
+        Add add a new column to a table, and optionally fill it.
+
+        * The kind option is the SQL type of the column, 'text' by default.
+
+        * The values option can be:
+            - A function that receives a dataframe holding a batch of rows
+              (including a `rowid` column) and returns a sequence with one
+              new value per row, ideally computed in a vectorized way.
+            - A pandas series. Its index should contain the rowids, or
+              the values of the column given in the `on` option.
+
+        The values are written with batched `UPDATE` statements, committing
+        after every batch of `batch_size` rows.
+        """
+        # Default values #
+        if table is None: table = self.main_table
+        if kind is None:  kind  = 'text'
+        # Add the column #
+        query = 'ALTER TABLE "%s" ADD COLUMN "%s" %s;' % (table, name, kind)
+        self.own_cursor.execute(query)
+        self.own_connection.commit()
+        # Nothing to fill #
+        if values is None: return
+        # Display progress bar #
+        if progress:
+            import tqdm
+            progress = tqdm.tqdm
+        else:
+            progress = lambda x:x
+        # Fill from a series #
+        if isinstance(values, pandas.Series):
+            # Every update looks up one row #
+            if on is not None: self.index(on, table=table)
+            key    = 'rowid' if on is None else '"%s"' % on
+            update = 'UPDATE "%s" SET "%s"=? WHERE %s=?;' % (table, name, key)
+            pairs  = list(zip(series_to_python(values), series_to_python(values.index)))
+            for start in progress(range(0, len(pairs), batch_size)):
+                self.own_cursor.executemany(update, pairs[start:start+batch_size])
+                self.own_connection.commit()
+            return
+        # Fill from a function, going through the table by rowid ranges #
+        update = 'UPDATE "%s" SET "%s"=? WHERE rowid=?;' % (table, name)
+        # With an INTEGER PRIMARY KEY a plain `rowid` would take its name #
+        select = 'SELECT rowid AS "__rowid", * FROM "%s" WHERE rowid > ?' \
+                 ' ORDER BY rowid LIMIT %i;'
+        select = select % (table, batch_size)
+        cursor = self.open_cursor()
+        cursor.row_factory = None
+        total  = math.ceil(self.count_entries(table) / batch_size)
+        last   = (self.get_rowid_bounds(table)[0] or 0) - 1
+        for i in progress(range(total)):
+            # Read a batch #
+            cursor.execute(select, (last,))
+            names = [x[0] for x in cursor.description]
+            df    = pandas.DataFrame.from_records(cursor.fetchall(), columns=names)
+            if df.empty: break
+            rowids = df.pop('__rowid')
+            if 'rowid' not in df: df.insert(0, 'rowid', rowids)
+            # Compute the new values #
+            result = values(df)
+            if not isinstance(result, pandas.Series): result = pandas.Series(result)
+            # Write them #
+            pairs = zip(series_to_python(result), series_to_python(rowids))
+            self.own_cursor.executemany(update, pairs)
+            self.own_connection.commit()
+            last = int(rowids.iloc[-1])
+        self.release_cursor(cursor)
+
+    def uniquify(self, column='id', table=None, new_table=None,
+                 batch_size=100000, progress=False):
+        """
+        Remove entries that have duplicate values on a specific column,
+        keeping the first one inserted (the smallest rowid).
+
+        * The new_table option leaves the table untouched and instead
+          writes the unique entries to a new table of that name.
+
+        An index on the column is created if needed, so that finding the
+        rows to keep is done by walking the index. When working in place,
+        the deletions are done by batches of rowids, which allows
+        reporting progress. Returns the number of rows removed.
+        """
+        # Default values #
+        if table is None: table = self.main_table
+        # Display progress bar #
+        if progress:
+            import tqdm
+            progress = tqdm.tqdm
+        else:
+            progress = lambda x:x
+        # The index makes the GROUP BY cheap #
+        self.index(column, table=table)
+        before = self.count_entries(table)
+        keep   = 'SELECT MIN(rowid) FROM "%s" GROUP BY "%s"' % (table, column)
+        # Into a new table #
+        if new_table is not None:
+            query = 'CREATE TABLE "%s" AS SELECT * FROM "%s" WHERE 0;'
+            self.own_cursor.execute(query % (new_table, table))
+            query = 'INSERT INTO "%s" SELECT * FROM "%s" WHERE rowid IN (%s) ORDER BY rowid;'
+            self.own_cursor.execute(query % (new_table, table, keep))
+            self.own_connection.commit()
+            return before - self.count_entries(new_table)
+        # Remember which rows to keep #
+        self.own_cursor.execute('DROP TABLE if exists temp."uniquify_keep";')
+        query = 'CREATE TEMP TABLE "uniquify_keep" (rowid INTEGER PRIMARY KEY);'
+        self.own_cursor.execute(query)
+        self.own_cursor.execute('INSERT INTO temp."uniquify_keep" %s;' % keep)
+        # Delete by ranges of existing rowids #
+        query = 'DELETE FROM "%s" WHERE rowid BETWEEN ? AND ? AND NOT EXISTS ' \
+                '(SELECT 1 FROM temp."uniquify_keep" k WHERE k.rowid = "%s".rowid);'
+        query = query % (table, table)
+        for start, end in progress(self.get_rowid_ranges(batch_size, table)):
+            self.own_cursor.execute(query, (start, end))
+            self.own_connection.commit()
+        # Clean up #
+        self.own_cursor.execute('DROP TABLE temp."uniquify_keep";')
+        return before - self.count_entries(table)
+
+    # --------------------------- Full-text search -------------------------- #
+    def add_search_index(self, columns, table=None, tokenizer=None, triggers=True):
+        """
+        Build an FTS5 full-text index over some text columns of a table.
+        It's an external-content index: the text is not duplicated, only
+        the index is stored, in a virtual table named `<table>_fts`.
+        Triggers keep it up to date when rows are inserted, deleted or
+        updated. Compressed columns cannot be indexed.
+
+        * The tokenizer option is passed to FTS5, e.g. 'porter unicode61'.
+
+        * The triggers option can be disabled for bulk loading, see
+          `rebuild_search_index()`.
+        """
+        if table is None: table = self.main_table
+        # Create the virtual table #
+        cols  = ','.join('"' + c + '"' for c in columns)
+        query = 'CREATE VIRTUAL TABLE "%s_fts" USING fts5(%s, content="%s", content_rowid="rowid"'
+        query = query % (table, cols, table)
+        if tokenizer is not None: query += ", tokenize='%s'" % tokenizer
+        self.own_cursor.execute(query + ');')
+        # Index the existing rows #
+        self.rebuild_search_index(table, triggers=triggers)
+
+    def get_search_columns(self, table=None):
+        """The columns covered by the full-text index of a table."""
+        if table is None: table = self.main_table
+        return list(self.get_column_types(table + '_fts'))
+
+    def set_search_triggers(self, enabled=True, table=None):
+        """
+        Create or drop the triggers that keep the full-text index in sync.
+        Dropping them makes bulk insertions faster, but the index must then
+        be rebuilt afterwards.
+        """
+        if table is None: table = self.main_table
+        fts = table + '_fts'
+        # Drop them #
+        for suffix in ('insert', 'delete', 'update'):
+            self.own_cursor.execute('DROP TRIGGER if exists "%s_%s";' % (fts, suffix))
+        if not enabled: return
+        # The values #
+        columns = self.get_search_columns(table)
+        cols    = ','.join('"' + c + '"' for c in columns)
+        new     = ','.join('new."' + c + '"' for c in columns)
+        old     = ','.join('old."' + c + '"' for c in columns)
+        insert  = 'INSERT INTO "%s"(rowid, %s) VALUES (new.rowid, %s);' % (fts, cols, new)
+        delete  = 'INSERT INTO "%s"("%s", rowid, %s) VALUES (\'delete\', old.rowid, %s);'
+        delete  = delete % (fts, fts, cols, old)
+        # Create them #
+        trigger = 'CREATE TRIGGER "%s_%s" AFTER %s ON "%s" BEGIN %s END;'
+        self.own_cursor.execute(trigger % (fts, 'insert', 'INSERT', table, insert))
+        self.own_cursor.execute(trigger % (fts, 'delete', 'DELETE', table, delete))
+        self.own_cursor.execute(trigger % (fts, 'update', 'UPDATE', table, delete + insert))
+
+    def rebuild_search_index(self, table=None, triggers=True):
+        """
+        Rebuild the full-text index from the content of the table, then
+        merge its internal b-trees. This is the fast path after a large
+        load done with the triggers disabled:
+
+            >>> db.set_search_triggers(False)
+            >>> db.add(many_entries)
+            >>> db.rebuild_search_index()
+        """
+        if table is None: table = self.main_table
+        fts = table + '_fts'
+        self.own_cursor.execute('INSERT INTO "%s"("%s") VALUES (\'rebuild\');' % (fts, fts))
+        self.own_cursor.execute('INSERT INTO "%s"("%s") VALUES (\'optimize\');' % (fts, fts))
+        self.set_search_triggers(triggers, table)
+        self.own_connection.commit()
+
+    def search(self, query, limit=10, table=None):
+        """
+        Return the rows of a table matching a full-text query, the most
+        relevant first according to the bm25 ranking. The query follows
+        the FTS5 syntax, e.g. 'ocean AND (salinity OR depth)' or 'cook*'.
+        """
+        if table is None: table = self.main_table
+        fts = table + '_fts'
+        command = 'SELECT "%s".* FROM "%s" JOIN "%s" ON "%s".rowid = "%s".rowid' \
+                  ' WHERE "%s" MATCH ? ORDER BY bm25("%s") LIMIT ?;'
+        command = command % (table, fts, table, table, fts, fts, fts)
+        return self.table_cursor(table).execute(command, (query, limit)).fetchall()
+
+    # ------------------------------ Summaries ------------------------------ #
+    # The table where the materialized summaries are declared #
+    summaries_table = 'materialized_summaries'
+
+    # The supported aggregates #
+    summary_funcs = ('count', 'sum', 'min', 'max', 'avg')
+
+    def materialize(self, name, by, funcs, table=None, triggers=True):
+        """
+        Create a table named `name` holding the result of a `GROUP BY` over
+        another table, and keep it current incrementally with triggers as
+        rows are inserted, deleted or updated. Reading it then costs one row
+        per group instead of a scan of the whole table.
+
+        * The by option is a column name or a list of column names.
+
+        * The funcs option maps column names to one of 'count', 'sum',
+          'min', 'max' or 'avg'. Every group also gets its number of rows
+          in a column named `rows`.
+
+        * The triggers option can be disabled for bulk loading, see
+          `refresh_summary()`.
+
+        Sums of groups without any value are 0 instead of NULL. Deleting the
+        current minimum or maximum of a group rescans that group only, using
+        an index on the `by` columns that is created for this purpose.
+
+            >>> db.materialize('by_sample', 'sample_id', {'length': 'avg'})
+            >>> db.read_summary('by_sample')
+        """
+        # Default values #
+        if table is None: table = self.main_table
+        if isinstance(by, str): by = [by]
+        # Checks #
+        unknown = set(funcs.values()) - set(self.summary_funcs)
+        if unknown: raise Exception("Unsupported aggregates: %s" % unknown)
+        if name in self.tables: raise Exception("The table '%s' already exists." % name)
+        # The columns of the summary #
+        columns = ['"%s"' % c for c in by] + ['"rows" integer DEFAULT 0']
+        for col, func in funcs.items():
+            if func == 'avg':
+                columns.append('"%s__sum" DEFAULT 0'   % col)
+                columns.append('"%s__count" DEFAULT 0' % col)
+            elif func in ('count', 'sum'):
+                columns.append('"%s" DEFAULT 0' % col)
+            else:
+                columns.append('"%s"' % col)
+        self.own_cursor.execute('CREATE TABLE "%s" (%s);' % (name, ','.join(columns)))
+        # Groups are looked up at every change #
+        self.index(by, table=name, name=name + '_groups', unique=True)
+        # Extrema are recomputed from the group #
+        if {'min', 'max'} & set(funcs.values()): self.index(by, table=table)
+        # Save the definition #
+        query = 'CREATE TABLE if not exists "%s" (name text PRIMARY KEY,' \
+                ' table_name text, by_columns text, funcs text);'
+        self.own_cursor.execute(query % self.summaries_table)
+        query = 'INSERT INTO "%s" VALUES (?,?,?,?);' % self.summaries_table
+        self.own_cursor.execute(query, (name, table, json.dumps(by), json.dumps(funcs)))
+        # Fill it #
+        self.refresh_summary(name, triggers=triggers)
+
+    def get_summary(self, name):
+        """The source table, the `by` columns and the `funcs` of a summary."""
+        query = 'SELECT table_name, by_columns, funcs FROM "%s" WHERE name=?;'
+        cursor = self.own_connection.cursor()
+        cursor.row_factory = None
+        row = cursor.execute(query % self.summaries_table, (name,)).fetchone()
+        if row is None: raise Exception("There is no summary named '%s'." % name)
+        return row[0], json.loads(row[1]), json.loads(row[2])
+
+    def refresh_summary(self, name, triggers=True):
+        """
+        Recompute a summary from scratch with a single `GROUP BY`. This is
+        the fast path after a large load done with the triggers disabled:
+
+            >>> db.set_summary_triggers('by_sample', False)
+            >>> db.add(many_entries)
+            >>> db.refresh_summary('by_sample')
+        """
+        table, by, funcs = self.get_summary(name)
+        # The aggregates #
+        columns, parts = ['rows'], ['COUNT(1)']
+        for col, func in funcs.items():
+            if func == 'avg':
+                columns += [col + '__sum', col + '__count']
+                parts   += ['coalesce(SUM("%s"), 0)' % col, 'COUNT("%s")' % col]
+            elif func == 'sum':
+                columns.append(col)
+                parts.append('coalesce(SUM("%s"), 0)' % col)
+            else:
+                columns.append(col)
+                parts.append('%s("%s")' % (func.upper(), col))
+        # The query #
+        group   = ','.join('"' + c + '"' for c in by)
+        columns = ','.join('"' + c + '"' for c in columns)
+        query   = 'INSERT INTO "%s" (%s,%s) SELECT %s,%s FROM "%s" GROUP BY %s;'
+        query   = query % (name, group, columns, group, ','.join(parts), table, group)
+        # Run it #
+        self.own_cursor.execute('DELETE FROM "%s";' % name)
+        self.own_cursor.execute(query)
+        self.set_summary_triggers(name, triggers)
+        self.own_connection.commit()
+
+    def set_summary_triggers(self, name, enabled=True):
+        """
+        Create or drop the triggers that keep a summary in sync. Dropping
+        them makes bulk insertions faster, but the summary must then be
+        refreshed afterwards.
+        """
+        # Drop them #
+        for suffix in ('insert', 'delete', 'update'):
+            self.own_cursor.execute('DROP TRIGGER if exists "%s_%s";' % (name, suffix))
+        if not enabled: return
+        # The statements #
+        table, by, funcs = self.get_summary(name)
+        add    = self.summary_statements(name, table, by, funcs, 'new')
+        remove = self.summary_statements(name, table, by, funcs, 'old')
+        # Updates only matter if they touch a column used #
+        used = ','.join('"' + c + '"' for c in dict.fromkeys(by + list(funcs)))
+        # Create them #
+        trigger = 'CREATE TRIGGER "%s_%s" AFTER %s ON "%s" BEGIN %s END;'
+        self.own_cursor.execute(trigger % (name, 'insert', 'INSERT', table, add))
+        self.own_cursor.execute(trigger % (name, 'delete', 'DELETE', table, remove))
+        self.own_cursor.execute(trigger % (name, 'update', 'UPDATE OF ' + used,
+                                           table, remove + ' ' + add))
+
+    @staticmethod
+    def summary_statements(name, table, by, funcs, row):
+        """
+        The SQL executed by a trigger to add the `new` row to its group,
+        or to remove the `old` row from its group.
+        """
+        # How to find the group #
+        match = ' AND '.join('"%s" IS %s."%s"' % (c, row, c) for c in by)
+        # Adding a row #
+        if row == 'new':
+            values = ','.join('new."%s"' % c for c in by)
+            group  = ','.join('"%s"' % c for c in by)
+            create = 'INSERT INTO "%s" (%s) SELECT %s WHERE NOT EXISTS' \
+                     ' (SELECT 1 FROM "%s" WHERE %s);'
+            create = create % (name, group, values, name, match)
+            sets   = ['"rows" = "rows" + 1']
+            for col, func in funcs.items():
+                value = 'new."%s"' % col
+                if func in ('count', 'avg'):
+                    target = col + '__count' if func == 'avg' else col
+                    sets.append('"%s" = "%s" + (%s IS NOT NULL)' % (target, target, value))
+                if func in ('sum', 'avg'):
+                    target = col + '__sum' if func == 'avg' else col
+                    sets.append('"%s" = "%s" + coalesce(%s, 0)' % (target, target, value))
+                if func in ('min', 'max'):
+                    sets.append('"%s" = coalesce(%s("%s", %s), "%s", %s)' %
+                                (col, func, col, value, col, value))
+            update = 'UPDATE "%s" SET %s WHERE %s;' % (name, ','.join(sets), match)
+            return create + ' ' + update
+        # Removing a row #
+        sets = ['"rows" = "rows" - 1']
+        for col, func in funcs.items():
+            value = 'old."%s"' % col
+            if func in ('count', 'avg'):
+                target = col + '__count' if func == 'avg' else col
+                sets.append('"%s" = "%s" - (%s IS NOT NULL)' % (target, target, value))
+            if func in ('sum', 'avg'):
+                target = col + '__sum' if func == 'avg' else col
+                sets.append('"%s" = "%s" - coalesce(%s, 0)' % (target, target, value))
+            if func in ('min', 'max'):
+                source = ' AND '.join('"%s"."%s" IS old."%s"' % (table, c, c) for c in by)
+                rescan = '(SELECT %s("%s"."%s") FROM "%s" WHERE %s)'
+                rescan = rescan % (func.upper(), table, col, table, source)
+                sets.append('"%s" = CASE WHEN %s = "%s" THEN %s ELSE "%s" END' %
+                            (col, value, col, rescan, col))
+        update = 'UPDATE "%s" SET %s WHERE %s;' % (name, ','.join(sets), match)
+        delete = 'DELETE FROM "%s" WHERE %s AND "rows" <= 0;' % (name, match)
+        return update + ' ' + delete
+
+    def read_summary(self, name, where=None):
+        """
+        Read a summary as a dataframe, with the averages computed from
+        their stored sums and counts.
+
+        * The where option is an SQL condition on the columns of the
+          summary table, such as `"rows > 10"`.
+        """
+        table, by, funcs = self.get_summary(name)
+        # The columns #
+        columns = ['"%s"' % c for c in by] + ['"rows"']
+        for col, func in funcs.items():
+            if func == 'avg': columns.append('1.0 * "%s__sum" / "%s__count" AS "%s"' % (col, col, col))
+            else:             columns.append('"%s"' % col)
+        # The query #
+        query = 'SELECT %s FROM "%s"' % (','.join(columns), name)
+        if where is not None: query += ' WHERE %s' % where
+        # Run it #
+        cursor = self.own_connection.cursor()
+        cursor.row_factory = None
+        cursor.execute(query + ';')
+        names = [x[0] for x in cursor.description]
+        return pandas.DataFrame.from_records(cursor.fetchall(), columns=names)
+
+    def drop_summary(self, name):
+        """Remove a summary, its triggers and its definition."""
+        self.set_summary_triggers(name, False)
+        self.own_cursor.execute('DROP TABLE if exists "%s";' % name)
+        query = 'DELETE FROM "%s" WHERE name=?;' % self.summaries_table
+        self.own_cursor.execute(query, (name,))
+        self.own_connection.commit()
+
+    # ----------------------------- Compression ----------------------------- #
+    def load_codecs(self, connection):
+        """
+        Read the declarations of compressed columns from the database.
+        Returns a dictionary of dictionaries: table -> column -> codec.
+        """
+        cursor = connection.cursor()
+        cursor.row_factory = None
+        query  = 'SELECT 1 FROM sqlite_master WHERE type=\'table\' AND name=?;'
+        if cursor.execute(query, (meta_table,)).fetchone() is None: return {}
+        query  = 'SELECT table_name, column_name, method, level, dictionary FROM "%s";'
+        result = {}
+        for table, column, method, level, dictionary in cursor.execute(query % meta_table):
+            result.setdefault(table, {})[column] = ColumnCodec(method, level, dictionary)
+        return result
+
+    def get_codecs(self, table=None):
+        """The codecs of the compressed columns of a table, by column name."""
+        if table is None: table = self.main_table
+        if self.codecs is None: self.codecs = self.load_codecs(self.own_connection)
+        return self.codecs.get(table, {})
+
+    def make_row_factory(self, codecs):
+        """
+        A row factory for the cursors reading a table that has compressed
+        columns, see `table_cursor()`. Given the codecs of that table by
+        column name, it decompresses their BLOB values and then calls the
+        user's factory.
+        """
+        user = self.factory
+        def factory(cursor, row):
+            row = tuple(codecs[d[0]].decompress(v) if d[0] in codecs else v
+                        for d, v in zip(cursor.description, row))
+            return user(cursor, row) if user else row
+        return factory
+
+    def set_compression(self, column, method='zlib', level=None, dictionary=None,
+                        table=None):
+        """
+        Declare that a column is stored compressed. The declaration is saved
+        in a table named `compressed_columns` within the database itself.
+        Values already stored are not compressed retroactively, but plain
+        text values are still returned as is.
+        """
+        if table is None: table = self.main_table
+        codec = ColumnCodec(method, level, dictionary)
+        # Save it #
+        self.create_meta_table()
+        query = 'INSERT OR REPLACE INTO "%s" VALUES (?,?,?,?,?);' % meta_table
+        self.own_cursor.execute(query, (table, column, method, codec.level, dictionary))
+        self.own_connection.commit()
+        # Update the codecs #
+        self.reload_codecs()
+
+    def create_meta_table(self):
+        """Create the table where the compressed columns are declared."""
+        query = 'CREATE TABLE if not exists "%s" (table_name text, column_name text,' \
+                ' method text, level integer, dictionary blob,' \
+                ' PRIMARY KEY (table_name, column_name));'
+        self.own_cursor.execute(query % meta_table)
+
+    def reload_codecs(self):
+        """Read the declarations of compressed columns again."""
+        self.codecs = self.load_codecs(self.own_connection)
+
+    def copy_attached_codecs(self, names, alias='source'):
+        """
+        Copy the declarations of the compressed columns of some tables from
+        the database currently attached. Our own declarations are kept when
+        both databases have one for the same column.
+        """
+        query = 'SELECT 1 FROM "%s".sqlite_master WHERE type=\'table\' AND name=?;'
+        if self.own_cursor.execute(query % alias, (meta_table,)).fetchone() is None: return
+        if not names: return
+        self.create_meta_table()
+        marks = ','.join('?' for name in names)
+        query = 'INSERT OR IGNORE INTO "%s" SELECT * FROM "%s"."%s" WHERE table_name IN (%s);'
+        self.own_cursor.execute(query % (meta_table, alias, meta_table, marks), list(names))
+
+    def train_compression(self, column, samples, size=32768, table=None):
+        """
+        Build a dictionary shared by all values of a compressed column,
+        from a sample of its values (e.g. the first thousand entries you
+        are about to add). This must be done before any row is added, since
+        the same dictionary is needed to decompress.
+        """
+        if table is None: table = self.main_table
+        codec = self.get_codecs(table).get(column)
+        if codec is None:
+            raise Exception("The column '%s' is not compressed." % column)
+        # Check it's empty #
+        query = 'SELECT EXISTS(SELECT 1 FROM "%s" WHERE "%s" IS NOT NULL LIMIT 1);'
+        if self.own_cursor.execute(query % (table, column)).fetchone()[0]:
+            raise Exception("The column '%s' already contains values." % column)
+        # Train #
+        dictionary = ColumnCodec.train(codec.method, samples, size)
+        self.set_compression(column, codec.method, codec.level, dictionary, table)
+
+    # ----------------------------- Unfinished ------------------------------ #
     def get_and_order(self, ids, column=None, table=None):
         """Get specific entries and order them in the same way."""
         command = """
@@ -407,8 +2069,336 @@ class SQLiteDatabase(FilePath):
         # ORDER BY instr(',%s,', ',' || id || ',')
 
     # ---------------------------- Multi-database --------------------------- #
-    def import_table(self, source, table_name):
-        """Copy a table from another SQLite database to this one."""
-        query = "SELECT * FROM `%s`" % table_name.lower()
-        df = pandas.read_sql(query, source.connection)
-        df.to_sql(table_name, con=self.own_connection)
+    def import_table(self, source, table_name, method='attach'):
+        """
+        Copy a table from another SQLite database to this one.
+
+        With the default 'attach' method, the other database is attached
+        and the rows are copied by the SQLite engine with a single
+        `INSERT INTO ... SELECT` inside one transaction. The original
+        schema, including declared types and indexes, is preserved.
+
+        With the 'pandas' method, the table goes through a dataframe.
+        """
+        # Method via a dataframe #
+        if method == 'pandas':
+            query = "SELECT * FROM `%s`" % table_name.lower()
+            df = pandas.read_sql(query, source.connection)
+            df.to_sql(table_name, con=self.own_connection)
+            return
+        # Check it's not there already #
+        if table_name in self.tables:
+            raise Exception("The table '%s' already exists in '%s'." % (table_name, self))
+        # Method with the engine #
+        self.attach(source)
+        try:
+            self.copy_from_attached(table_name)
+            self.copy_attached_codecs([table_name])
+            self.own_connection.commit()
+            for sql in self.get_attached_indexes(table_name): self.own_cursor.execute(sql)
+            self.own_connection.commit()
+        except KeyboardInterrupt as err:
+            print("You interrupted the table import. Rolling back.")
+            self.own_connection.rollback()
+            raise err
+        finally:
+            self.detach()
+        # The table might have compressed columns #
+        self.reload_codecs()
+
+    def merge_from(self, sources, tables=None, ignore=False, progress=False,
+                   exclude=None):
+        """
+        Concatenate the tables of several other SQLite databases into this
+        one. Typically used to gather the shards produced by parallel jobs.
+
+        * The sources option is an iterable of `SQLiteDatabase` objects
+          or of paths.
+
+        * The tables option restricts which tables are merged. By default
+          every table found in the first source is merged.
+
+        * The ignore option will skip rows that violate a uniqueness
+          constraint instead of raising an error.
+
+        * The exclude option is a list of tables never merged. By default
+          the tables of `maintain_count()` and `materialize()` as well as
+          the summaries themselves, since their rows describe each source.
+          Refresh the summaries afterwards.
+
+        The internal tables of SQLite and the full-text indexes are never
+        merged, rebuild the latter afterwards. The declarations of
+        compressed columns are copied for the tables merged, keeping the
+        first one found. Missing tables are created with the schema of the
+        first source that has them. Their indexes are only built once all
+        rows are inserted, which is much faster than updating them at every
+        insertion.
+        """
+        # Display progress bar #
+        if progress:
+            import tqdm
+            sources = tqdm.tqdm(sources)
+        # Default value #
+        skip_meta = exclude is None
+        if exclude is None: exclude = [self.counts_table, self.summaries_table]
+        exclude = list(exclude) + [meta_table]
+        # The indexes to create at the end #
+        indexes = {}
+        # Main loop #
+        for source in sources:
+            self.attach(source)
+            try:
+                # Which tables #
+                names = tables if tables is not None else self.get_attached_tables()
+                names = [name for name in names if name not in exclude]
+                if skip_meta:
+                    summaries = self.get_attached_summaries()
+                    names     = [name for name in names if name not in summaries]
+                # Collect the indexes to create later #
+                for name in names:
+                    if name in self.tables: continue
+                    indexes[name] = self.get_attached_indexes(name)
+                # One transaction per source #
+                for name in names: self.copy_from_attached(name, ignore=ignore)
+                self.copy_attached_codecs(names)
+                self.own_connection.commit()
+            except KeyboardInterrupt as err:
+                print("You interrupted the merge. Rolling back the current source.")
+                self.own_connection.rollback()
+                raise err
+            finally:
+                self.detach()
+            # Only use the tables of the first source by default #
+            if tables is None: tables = names
+        # Build the indexes #
+        for sql in (sql for name in indexes for sql in indexes[name]):
+            self.own_cursor.execute(sql)
+        self.own_connection.commit()
+        # The merged tables might have compressed columns #
+        self.reload_codecs()
+
+    def attach(self, source, alias='source'):
+        """
+        Attach another database to the internal connection. Any pending
+        transaction is committed first since SQLite forbids attaching
+        inside a transaction.
+        """
+        if self.own_connection.in_transaction: self.own_connection.commit()
+        path = getattr(source, 'path', source)
+        self.own_cursor.execute('ATTACH DATABASE ? AS "%s";' % alias, (str(path),))
+
+    def detach(self, alias='source'):
+        """Detach a database previously attached to the internal connection."""
+        if self.own_connection.in_transaction: self.own_connection.commit()
+        self.own_cursor.execute('DETACH DATABASE "%s";' % alias)
+
+    def get_attached_tables(self, alias='source'):
+        """
+        The list of tables in the database currently attached, without the
+        internal tables of SQLite and without the virtual tables, such as
+        full-text indexes, nor their shadow tables.
+        """
+        query  = 'SELECT name, sql FROM "%s".sqlite_master WHERE type=\'table\';' % alias
+        cursor = self.own_connection.cursor()
+        cursor.row_factory = None
+        rows   = cursor.execute(query).fetchall()
+        # Virtual tables store their content in tables prefixed by their name #
+        virtual = [name for name, sql in rows
+                   if (sql or '').upper().startswith('CREATE VIRTUAL TABLE')]
+        shadow  = lambda n: any(n.startswith(v + '_') for v in virtual)
+        return [name for name, sql in rows if not name.startswith('sqlite_')
+                and name not in virtual and not shadow(name)]
+
+    def get_attached_summaries(self, alias='source'):
+        """The names of the summaries made by `materialize()` in the attached database."""
+        if self.summaries_table not in self.get_attached_tables(alias): return []
+        query  = 'SELECT name FROM "%s"."%s";' % (alias, self.summaries_table)
+        cursor = self.own_connection.cursor()
+        cursor.row_factory = None
+        return [x[0] for x in cursor.execute(query).fetchall()]
+
+    def get_attached_schema(self, table_name, alias='source'):
+        """The `CREATE TABLE` statement of a table in the attached database."""
+        query = 'SELECT sql FROM "%s".sqlite_master WHERE type=\'table\' AND name=?;'
+        row   = self.own_connection.execute(query % alias, (table_name,)).fetchone()
+        if row is None:
+            raise Exception("The table '%s' does not exist in the attached database." % table_name)
+        return row[0]
+
+    def get_attached_indexes(self, table_name, alias='source'):
+        """The `CREATE INDEX` statements of a table in the attached database."""
+        query = 'SELECT sql FROM "%s".sqlite_master' \
+                ' WHERE type=\'index\' AND tbl_name=? AND sql IS NOT NULL;'
+        rows  = self.own_connection.execute(query % alias, (table_name,)).fetchall()
+        return [x[0] for x in rows]
+
+    def copy_from_attached(self, table_name, ignore=False, alias='source'):
+        """
+        Insert all rows of a table from the attached database into the
+        table with the same name in this database, creating it if needed.
+        A transaction is opened but it's up to the caller to commit.
+        """
+        if not self.own_connection.in_transaction: self.own_cursor.execute('BEGIN;')
+        # Create the table with the same declared schema #
+        if table_name not in self.tables:
+            self.own_cursor.execute(self.get_attached_schema(table_name, alias))
+        # Copy the rows #
+        ignore = " OR IGNORE" if ignore else ""
+        query  = 'INSERT%s INTO main."%s" SELECT * FROM "%s"."%s";'
+        self.own_cursor.execute(query % (ignore, table_name, alias, table_name))
+
+################################################################################
+def sql_affinity(declared):
+    """
+    Apply the rules of SQLite to find the affinity of a declared column type.
+    See https://www.sqlite.org/datatype3.html#determination_of_column_affinity
+    """
+    declared = declared.upper()
+    if 'INT' in declared:                                   return 'integer'
+    if any(t in declared for t in ('CHAR', 'CLOB', 'TEXT')): return 'text'
+    if 'BLOB' in declared or not declared:                  return 'blob'
+    if any(t in declared for t in ('REAL', 'FLOA', 'DOUB')): return 'real'
+    return 'numeric'
+
+def is_select(sql):
+    """Is this statement a query that only reads?"""
+    return sql.lstrip().upper().startswith(('SELECT', 'WITH'))
+
+def compress_entry(entry, codecs):
+    """Compress some values of an entry, given a list of (position, codec)."""
+    entry = list(entry)
+    for i, codec in codecs: entry[i] = codec.compress(entry[i])
+    return entry
+
+def strict_type(declared):
+    """The type of a `STRICT` table column with the same affinity."""
+    if not declared: return 'ANY'
+    kinds = {'integer': 'INTEGER', 'real': 'REAL', 'text': 'TEXT', 'blob': 'BLOB'}
+    return kinds.get(sql_affinity(declared), 'ANY')
+
+# Strings that SQLite converts to numbers without losing anything #
+re_int  = re.compile(r'[-+]?(?:0|[1-9]\d*)')
+re_real = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+re_zero = re.compile(r'[-+]?0\d')
+
+def infer_sql_type(values):
+    """
+    Pick the narrowest SQL type among 'integer', 'real', 'text' and 'blob'
+    that can hold all the values given. Strings that look like numbers
+    count as numbers, since SQLite converts them in numeric columns, except
+    integers with leading zeros. Missing values are ignored, and a column
+    without any value is 'text'.
+    """
+    kinds = set()
+    for value in values:
+        if value is None or value == '':                    continue
+        if isinstance(value, (bytes, bytearray, memoryview)): return 'blob'
+        if isinstance(value, numbers.Integral):             kinds.add('integer')
+        elif isinstance(value, numbers.Real):               kinds.add('real')
+        elif not isinstance(value, str):                    kinds.add('text')
+        elif re_zero.match(value):                          kinds.add('text')
+        elif re_int.fullmatch(value):                       kinds.add('integer')
+        elif re_real.fullmatch(value):                      kinds.add('real')
+        else:                                               kinds.add('text')
+    if 'text' in kinds or not kinds: return 'text'
+    if 'real' in kinds:              return 'real'
+    return 'integer'
+
+def sql_type_of(dtype):
+    """The SQL type used to store a pandas dtype."""
+    if pandas.api.types.is_bool_dtype(dtype):           return 'integer'
+    if pandas.api.types.is_integer_dtype(dtype):        return 'integer'
+    if pandas.api.types.is_float_dtype(dtype):          return 'real'
+    if pandas.api.types.is_datetime64_any_dtype(dtype): return 'timestamp'
+    return 'text'
+
+def series_to_python(series):
+    """
+    Convert a series or an index to a list holding only values that the
+    sqlite3 module can bind: no numpy scalars, no NaN, and dates as text.
+    """
+    if pandas.api.types.is_datetime64_any_dtype(series.dtype):
+        return [None if pandas.isna(x) else x.isoformat(' ') for x in series]
+    series = pandas.Series(series)
+    return series.astype(object).where(series.notna(), None).tolist()
+
+def df_to_python(df):
+    """
+    Convert a dataframe to a list of tuples holding only values that the
+    sqlite3 module can bind: no numpy scalars, no NaN, and dates as text.
+    """
+    return list(zip(*[series_to_python(df[col]) for col in df.columns]))
+
+def safe_cast(series, dtype):
+    """Cast a series to a dtype, leave it untouched if the values don't fit."""
+    try: return series.astype(dtype)
+    except (ValueError, TypeError): return series
+
+def arrow_fit(values, kind):
+    """
+    Make the values of a column fit an Arrow type they could not be
+    converted to directly. Anything that is not a number becomes `None`
+    in a numeric type, and anything that is not text becomes text in a
+    string type.
+    """
+    import pyarrow
+    if pyarrow.types.is_integer(kind):
+        return [v if isinstance(v, int) else None for v in values]
+    if pyarrow.types.is_floating(kind):
+        return [v if isinstance(v, (int, float)) else None for v in values]
+    if pyarrow.types.is_string(kind):
+        return [v if v is None or isinstance(v, str) else str(v) for v in values]
+    return values
+
+# The database opened by each process of `SQLiteDatabase.parallel_map` #
+worker_database = None
+
+def init_map_worker(path, options):
+    """Open a read-only connection once in each worker process."""
+    global worker_database
+    worker_database = SQLiteDatabase(path, **options)
+    worker_database.prepared = True
+    worker_database.own_connection.execute('PRAGMA query_only = ON;')
+
+def map_rowid_range(task):
+    """Read one range of rowids and apply the function to its rows."""
+    query, table, start, end, func, batched = task
+    cursor = worker_database.table_cursor(table)
+    rows   = cursor.execute(query, (start, end)).fetchall()
+    if batched: return list(func(rows))
+    return [func(row) for row in rows]
+
+def concat_chunks(chunks):
+    """
+    Concatenate the dataframes produced by `SQLiteDatabase.iter_df`, which
+    can be a generator. Every chunk is split in columns that own their
+    memory, and is released right away. Then the final columns are built
+    one at a time, releasing their pieces as we go. Hence the peak memory
+    is the final dataframe plus one column, instead of twice the final
+    dataframe. Categorical columns stay categorical, with their categories
+    unified.
+    """
+    # Split every chunk in columns #
+    first, pieces = None, None
+    for chunk in chunks:
+        if pieces is None:
+            first, pieces = chunk, {col: [] for col in chunk.columns}
+            continue
+        if first is not None:
+            for col in pieces: pieces[col].append(first[col].copy())
+            first = None
+        for col in pieces: pieces[col].append(chunk[col].copy())
+        del chunk
+    # Simple cases #
+    if first is not None: return first
+    # Build the columns one by one #
+    columns = {}
+    for col in list(pieces):
+        parts = pieces.pop(col)
+        if isinstance(parts[0].dtype, pandas.CategoricalDtype):
+            columns[col] = pandas.Series(pandas.api.types.union_categoricals(parts), name=col)
+        else:
+            columns[col] = pandas.concat(parts, ignore_index=True)
+        del parts
+    # Return #
+    return pandas.DataFrame(columns, copy=False)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Typically you would run this file from a command line like this:
+
+    ipython -i -- ~/deploy/plumbing/tests/database/access_db/test_pipeline.py
+
+Requires the `mdb-schema` and `mdb-export` executables from mdbtools.
+"""
+
+# Built-in module #
+import inspect, os
+
+# Internal modules #
+from plumbing.databases.access_database import AccessDatabase
+from autopaths.file_path import FilePath
+
+# Constants #
+file_name = inspect.getframeinfo(inspect.currentframe()).filename
+this_dir  = os.path.dirname(os.path.abspath(file_name)) + '/'
+
+# Never modify the original #
+orig_db    = FilePath(this_dir + 'orig.mdb')
+testing_db = FilePath(this_dir + 'testing.mdb')
+orig_db.copy(testing_db)
+
+# The database #
+db = AccessDatabase(testing_db)
+
+# Convert with several exports at the same time #
+dest   = FilePath(this_dir + 'testing.sqlite')
+sqlite = db.convert_to_sqlite(dest, method='parallel', processes=2)
+
+# The number of rows in every table #
+for table in sqlite.tables: print(table, sqlite.count_entries(table))
+sqlite.close()
+
+# An error in one export stops all the others #
+dest.remove()
+try: db.sqlite_by_pipeline(dest, tables=db.tables + ['missing_table'])
+except Exception as err: print("Failed as expected: %s" % err)
+
+# Clean up #
+dest.remove()
+testing_db.remove()
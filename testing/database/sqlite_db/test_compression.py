@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Typically you would run this file from a command line like this:
+
+     ipython3 -i -- ~/repos/plumbing/testing/database/sqlite_db/test_compression.py
+"""
+
+# Built-in module #
+import inspect, os
+
+# Internal modules #
+from plumbing.databases.sqlite_database import SQLiteDatabase
+from autopaths.file_path import FilePath
+
+# Constants #
+file_name = inspect.getframeinfo(inspect.currentframe()).filename
+this_dir  = os.path.dirname(os.path.abspath(file_name)) + '/'
+
+# A new database with a compressed column #
+testing_db = FilePath(this_dir + 'compressed.db')
+testing_db.remove()
+db = SQLiteDatabase(testing_db)
+db.create({'id': 'text', 'seq': 'text'}, compress=['seq'])
+db.add([('a', 'ACGT' * 100), ('b', 'TTTT')])
+
+# Stored as BLOBs but read back as text #
+print(db.execute('SELECT length(seq) FROM data;').fetchall())
+assert db['a'][1] == 'ACGT' * 100
+assert list(db)[1] == ('b', 'TTTT')
+assert db.read_df()['seq'].tolist() == ['ACGT' * 100, 'TTTT']
+
+# A BLOB column with the same name in another table is left alone #
+db.add_table('raw', {'id': 'text', 'seq': 'blob'})
+db.add([('r', b'\x00\x01')], table='raw')
+assert db.get_entry('r', table='raw')[1] == b'\x00\x01'
+
+# Close #
+db.close()
+testing_db.remove()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Typically you would run this file from a command line like this:
+
+     ipython3 -i -- ~/repos/plumbing/testing/database/sqlite_db/test_export.py
+"""
+
+# Built-in module #
+import inspect, os
+
+# Internal modules #
+from plumbing.databases.sqlite_database import SQLiteDatabase
+from autopaths.file_path import FilePath
+
+# Constants #
+file_name = inspect.getframeinfo(inspect.currentframe()).filename
+this_dir  = os.path.dirname(os.path.abspath(file_name)) + '/'
+
+# Never modify the original #
+orig_db    = FilePath(this_dir + 'reads.db')
+testing_db = FilePath(this_dir + 'testing.db')
+orig_db.copy(testing_db)
+
+# The database, with an empty string in an integer column like old ones had #
+db = SQLiteDatabase(testing_db)
+db.own_cursor.execute("UPDATE data SET length='' WHERE rowid=5;")
+db.own_connection.commit()
+
+# As numpy arrays #
+arrays = db.read_columns(columns=['id', 'length', 'begin'], chunksize=10)
+print({col: array.dtype for col, array in arrays.items()})
+
+# As Arrow record batches #
+print(db.arrow_schema())
+for batch in db.iter_record_batches(batch_size=10): print(batch.num_rows)
+
+# As a Parquet file #
+parquet = FilePath(this_dir + 'testing.parquet')
+db.export_parquet(parquet, row_group_size=10)
+import pyarrow.parquet
+print(pyarrow.parquet.read_table(str(parquet)).column('length').null_count)
+
+# Close #
+db.close()
+parquet.remove()
+testing_db.remove()
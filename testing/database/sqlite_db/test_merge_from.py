@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Typically you would run this file from a command line like this:
+
+     ipython3 -i -- ~/repos/plumbing/testing/database/sqlite_db/test_merge_from.py
+"""
+
+# Built-in module #
+import inspect, os
+
+# Internal modules #
+from plumbing.databases.sqlite_database import SQLiteDatabase
+from autopaths.file_path import FilePath
+
+# Constants #
+file_name = inspect.getframeinfo(inspect.currentframe()).filename
+this_dir  = os.path.dirname(os.path.abspath(file_name)) + '/'
+
+# Two shards with a compressed column and a row count #
+shards = []
+for i in range(2):
+    path = FilePath(this_dir + 'shard_%i.db' % i)
+    path.remove()
+    shard = SQLiteDatabase(path)
+    shard.create({'id': 'text', 'seq': 'text'}, compress=['seq'])
+    shard.add([('s%i_%i' % (i, j), 'ACGT' * (j+1)) for j in range(5)])
+    shard.maintain_count()
+    shards.append(shard)
+
+# Merge them #
+merged_path = FilePath(this_dir + 'merged.db')
+merged_path.remove()
+merged = SQLiteDatabase(merged_path)
+merged.create()
+merged.merge_from(shards)
+
+# The values are still decompressed #
+print(merged.get_entry('s1_2'))
+assert merged.get_entry('s1_2')[1] == 'ACGTACGTACGT'
+assert len(merged) == 10
+
+# A single table #
+imported_path = FilePath(this_dir + 'imported.db')
+imported_path.remove()
+imported = SQLiteDatabase(imported_path)
+imported.create()
+imported.import_table(shards[0], 'data')
+assert imported.get_entry('s0_0')[1] == 'ACGT'
+
+# Clean up #
+for db in shards + [merged, imported]:
+    db.close()
+    db.path.remove()
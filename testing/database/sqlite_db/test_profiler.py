@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Typically you would run this file from a command line like this:
+
+     ipython3 -i -- ~/repos/plumbing/testing/database/sqlite_db/test_profiler.py
+"""
+
+# Built-in module #
+import inspect, os
+
+# Internal modules #
+from plumbing.databases.sqlite_database import SQLiteDatabase
+from autopaths.file_path import FilePath
+
+# Constants #
+file_name = inspect.getframeinfo(inspect.currentframe()).filename
+this_dir  = os.path.dirname(os.path.abspath(file_name)) + '/'
+
+# Never modify the original #
+orig_db    = FilePath(this_dir + 'reads.db')
+testing_db = FilePath(this_dir + 'testing.db')
+orig_db.copy(testing_db)
+
+# The database #
+db = SQLiteDatabase(testing_db, profile=True)
+
+# Some queries #
+for key in ('a', 'b', 'c'): db.get_entry(key)
+rows = db.execute('SELECT * FROM data WHERE length > 100;').fetchall()
+for row in db.execute('SELECT id FROM data;'): pass
+
+# The statistics, with the rows returned #
+print(db.profiler.df)
+print(db.profiler.full_scans)
+
+# Close #
+db.close()
+testing_db.remove()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Typically you would run this file from a command line like this:
+
+     ipython3 -i -- ~/repos/plumbing/testing/database/sqlite_db/test_read_df.py
+"""
+
+# Built-in module #
+import inspect, os
+
+# Internal modules #
+from plumbing.databases.sqlite_database import SQLiteDatabase
+from autopaths.file_path import FilePath
+
+# Constants #
+file_name = inspect.getframeinfo(inspect.currentframe()).filename
+this_dir  = os.path.dirname(os.path.abspath(file_name)) + '/'
+
+# Never modify the original #
+orig_db    = FilePath(this_dir + 'reads.db')
+testing_db = FilePath(this_dir + 'testing.db')
+orig_db.copy(testing_db)
+
+# The database #
+db = SQLiteDatabase(testing_db)
+
+# Declared types #
+print(db.get_column_types())
+
+# Whole table #
+print(db.df.dtypes)
+
+# Some columns only, with categories #
+df = db.read_df(columns=['id', 'begin', 'sample_name'], categories=0.5)
+print(df.dtypes)
+
+# By chunks #
+for chunk in db.read_df(where='length > 100', chunksize=10): print(chunk.shape)
+
+# Close #
+db.close()
+testing_db.remove()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Typically you would run this file from a command line like this:
+
+     ipython3 -i -- ~/repos/plumbing/testing/database/sqlite_db/test_sample.py
+"""
+
+# Built-in module #
+import inspect, os
+
+# Internal modules #
+from plumbing.databases.sqlite_database import SQLiteDatabase
+from autopaths.file_path import FilePath
+
+# Constants #
+file_name = inspect.getframeinfo(inspect.currentframe()).filename
+this_dir  = os.path.dirname(os.path.abspath(file_name)) + '/'
+
+# A table with very sparse rowids #
+testing_db = FilePath(this_dir + 'sparse.db')
+testing_db.remove()
+db = SQLiteDatabase(testing_db)
+db.create({'key': 'integer primary key', 'id': 'text'})
+db.add((i * 1000000, 'read_%i' % i) for i in range(1000))
+
+# Random access #
+print(db.get_rowid_bounds())
+print(db.get_number(500))
+print(db.sample(5, seed=1))
+print(list(db.iter_sample(3, seed=2)))
+
+# Ranges of rows for parallel work and batched deletions #
+print(db.get_rowid_ranges(300))
+print(db.uniquify(batch_size=300))
+
+# Close #
+db.close()
+testing_db.remove()
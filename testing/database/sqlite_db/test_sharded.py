@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Typically you would run this file from a command line like this:
+
+     ipython3 -i -- ~/repos/plumbing/testing/database/sqlite_db/test_sharded.py
+"""
+
+# Built-in module #
+import inspect, os
+
+# Internal modules #
+from plumbing.databases.sharded_database import ShardedDatabase
+from autopaths.dir_path import DirectoryPath
+
+# Constants #
+file_name = inspect.getframeinfo(inspect.currentframe()).filename
+this_dir  = os.path.dirname(os.path.abspath(file_name)) + '/'
+
+# Never mind what was there before #
+shards_dir = DirectoryPath(this_dir + 'shards/')
+shards_dir.remove()
+
+# The sharded database, one group out of five is NULL #
+db = ShardedDatabase(shards_dir, num_shards=4)
+db.create({'id': 'text', 'grp': 'text', 'length': 'integer'})
+groups = ['a', 'b', 'c', 'd', None]
+db.add(('read_%i' % i, groups[i % 5], i) for i in range(1000))
+
+# Lookups #
+print(db['read_42'])
+assert len(db) == 1000
+
+# Aggregates #
+result = db.aggregate(by='grp', funcs={'id': 'count', 'length': 'avg'})
+print(result)
+assert result['id'].sum() == 1000
+assert len(result) == 5
+
+# Clean up #
+db.close()
+shards_dir.remove()